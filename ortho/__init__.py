@@ -26,6 +26,11 @@ from .utils import confirm
 from .diagnose import linetime
 from .bash import bash
 from .bash import command_check
+from .bash import command_check_warm
+from .bash import bash_async
+from .bash import bash_gather
+from .bash import bash_many
+from .bash import ShellSession
 from .metadata import meta_hasher
 from .dispatch import dispatcher
 from .dispatch import DispatcherBase
@@ -37,14 +42,23 @@ from .yaml import YAMLObject
 from .yaml import YAMLIncludeBase
 from .yaml import YAMLIncludeBaseSafe
 from .yaml_trestle import Trestle
+from .yaml_trestle import TrestleRequired
+from .yaml_trestle import trestle_slots
 from .yaml_trestle import TrestleDocument
 from .yaml_trestle import build_trestle
+from .yaml_trestle import trestle_batch
 from .yaml_trestle import trestle_nesting_typer
 from .yaml import yaml_clean
 from .yaml import yaml_clean_class
 from .yaml import yaml_str
+from .yaml import yaml_stream
+from .yaml import yaml_representer
+from .yaml import yaml_add_representers
 from .git import code_current
 from .git import get_git_hash
+from .git import get_git_hash_cached
+from .git import git_status
+from .git import git_status_many
 from .functional import compose
 from .terminal_view import treeview
 from .text_viewer import text_viewer
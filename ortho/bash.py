@@ -4,17 +4,96 @@
 from .dotdict import DotDict
 
 import os,sys,subprocess,io,time,re
+import shlex
+import shutil
+import asyncio
+import concurrent.futures
+import collections
+import codecs
+import json
+import atexit
+import signal
+import resource
+import functools
 import threading
+import selectors
 import tempfile
 if (sys.version_info > (3, 0)): import queue  # pylint: disable=import-error
 else: import Queue as queue
 
 from ortho.reexec import tracebacker
+from .utils import get_cpu_cores
 
-def command_check(command,verbose=False):
+def command_path_mtimes(path):
+	"""Collect the modification times of the directories on a PATH."""
+	mtimes = []
+	for dn in path.split(os.pathsep):
+		try: mtimes.append(os.stat(dn or '.').st_mtime_ns)
+		except OSError: mtimes.append(None)
+	return tuple(mtimes)
+
+class CommandCache:
+	"""
+	Cache the location of commands for each PATH.
+	Adding or removing a program changes the modification time of its 
+	directory, so we clear the results for a PATH when any directory on it
+	changes. We check the times on every lookup unless you set `interval` to 
+	check them at most once every few seconds, in which case a program that 
+	appears within the interval is not found until it ends.
+	"""
+	def __init__(self,interval=None):
+		self.interval = interval
+		self.lock = threading.Lock()
+		# each PATH has the last check time, directory times, and results
+		self.paths = {}
+	def results(self,path):
+		"""Get the results for a PATH after checking the directories."""
+		now = time.time()
+		with self.lock:
+			entry = self.paths.get(path)
+			if entry and self.interval and now-entry[0] < self.interval: 
+				return entry[2]
+		mtimes = command_path_mtimes(path)
+		with self.lock:
+			entry = self.paths.get(path)
+			if not entry or entry[1] != mtimes:
+				entry = self.paths[path] = [now,mtimes,{}]
+			else: entry[0] = now
+			return entry[2]
+	def which(self,command):
+		"""Find a command on the current PATH."""
+		path = os.environ.get('PATH',os.defpath)
+		results = self.results(path)
+		if command not in results:
+			results[command] = shutil.which(command,path=path)
+		return results[command]
+	def warm(self,commands,workers=None):
+		"""Look up many commands in parallel."""
+		commands = list(commands)
+		if not commands: return {}
+		with concurrent.futures.ThreadPoolExecutor(
+			max_workers=workers or min(len(commands),8)) as pool:
+			return dict(zip(commands,pool.map(self.which,commands)))
+	def clear(self):
+		with self.lock: self.paths.clear()
+
+# process-wide cache for command_check
+command_cache = CommandCache()
+
+def command_check_warm(commands,workers=None):
+	"""
+	Check many commands in parallel so later calls to command_check are fast.
+	"""
+	return dict([(command,path!=None) for command,path 
+		in command_cache.warm(commands,workers=workers).items()])
+
+def command_check(command,verbose=False,cache=True):
 	"""Run a command and see if it completes with returncode zero."""
 	if verbose:
 		print('[STATUS] checking command "%s"'%command)
+	# paths to programs are not on the PATH so we only cache names
+	if cache and os.sep not in command:
+		return command_cache.which(command) != None
 	try:
 		from shutil import which
 		return which(command) != None
@@ -44,6 +123,74 @@ def reader(pipe,queue):
 				queue.put((pipe, line))
 	finally: queue.put(None)
 
+# precompile the pattern for "\r\n" or "^M"-style newlines
+re_newline = re.compile('\r\n?')
+
+class BashLineSplitter:
+	"""Split chunks of output into complete lines, like readline."""
+	def __init__(self):
+		self.partial = b''
+	def feed(self,chunk):
+		# split on newlines only, which matches readline
+		pieces = (self.partial+chunk).split(b'\n')
+		self.partial = pieces.pop()
+		return [piece+b'\n' for piece in pieces]
+	def close(self):
+		lines = [self.partial] if self.partial else []
+		self.partial = b''
+		return lines
+
+def bash_stream_lines(*pipes,chunk_size=65536):
+	"""
+	Read several pipes in a single loop and yield batches of complete lines.
+	This replaces the reader threads and queue for scrolling BASH output.
+	"""
+	sel = selectors.DefaultSelector()
+	splitters = {}
+	for pipe in pipes:
+		if pipe is None: continue
+		sel.register(pipe,selectors.EVENT_READ)
+		splitters[pipe] = BashLineSplitter()
+	try:
+		while sel.get_map():
+			for key,_ in sel.select():
+				pipe = key.fileobj
+				chunk = os.read(pipe.fileno(),chunk_size)
+				# the end of the stream flushes the incomplete line
+				if not chunk:
+					sel.unregister(pipe)
+					pipe.close()
+					lines = splitters[pipe].close()
+				else: lines = splitters[pipe].feed(chunk)
+				if lines: yield lines
+	finally: sel.close()
+
+def bash_log_prefix(line,log):
+	"""Prefix each line with the log file name for scrolling output."""
+	line_subs = ['[LOG] %s | %s'%(log,l.strip(' ')) 
+		for l in line.strip('\n').splitlines() if l] 
+	if not line_subs: return None
+	return '\n'.join(line_subs)+'\n'
+
+def bash_format_lines(lines,log=None):
+	"""
+	Decode a batch of lines and prepare them for the log and the screen.
+	"""
+	# decode early, encode late
+	lines = [line.decode('utf-8') for line in lines]
+	# note that sometimes we get a "\r\n" or "^M"-style newline
+	#   which makes the output appear inconsistent (some lines are 
+	#   prefixed) so we replace newlines, but only if we are also 
+	#   reporting the log file on the line next to the output. this 
+	#   can get cluttered so you can turn off scroll_log if you want
+	lines = [re_newline.sub('\n',line) if '\r' in line else line
+		for line in lines]
+	if log:
+		lines_here = [bash_log_prefix(line,log) for line in lines]
+		lines_here = [i for i in lines_here if i]
+	else: lines_here = lines
+	return lines,lines_here
+
 def bash_newliner(line_decode,log=None):
 	"""Handle weird newlines in BASH streams."""
 	# note that sometimes we get a "\r\n" or "^M"-style newline
@@ -59,13 +206,212 @@ def bash_newliner(line_decode,log=None):
 	line_here = ('\n'.join(line_subs)+'\n')
 	return line_here
 
+class BashCapture:
+	"""
+	Hold the output lines from a command according to a capture policy.
+	The policy is "full", "tail" for the last `lines` in a ring buffer, 
+	"head_tail" for the first and last `lines`, or "none" when you only need 
+	the log file. The log file is always complete.
+	"""
+	policies = ('full','tail','head_tail','none')
+	def __init__(self,policy='full',lines=1000):
+		if policy not in self.policies:
+			raise ValueError(f'invalid capture policy: {policy}')
+		self.policy = policy
+		self.head = []
+		self.head_size = lines if policy == 'head_tail' else 0
+		self.tail = (collections.deque(maxlen=lines) 
+			if policy in ('tail','head_tail') else [])
+		self.count = 0
+	def extend(self,lines):
+		self.count += len(lines)
+		if self.policy == 'none': return
+		if len(self.head) < self.head_size:
+			room = self.head_size-len(self.head)
+			self.head.extend(lines[:room])
+			lines = lines[room:]
+		self.tail.extend(lines)
+	def append(self,line):
+		self.extend([line])
+	@property
+	def dropped(self):
+		return self.count-len(self.head)-len(self.tail)
+	def join(self,sep):
+		return sep.join(self.head+list(self.tail))
+
+class BashPopen(subprocess.Popen):
+	"""
+	Popen that keeps the resource usage of the child when it is reaped.
+	"""
+	# we replace waitpid with wait4 in the two places Popen reaps the child
+	rusage = None
+	def _wait4(self,pid,flags):
+		pid_out,status,rusage = os.wait4(pid,flags)
+		if pid_out == self.pid: 
+			self.rusage = rusage
+		return pid_out,status
+	def _try_wait(self,wait_flags):
+		try: return self._wait4(self.pid,wait_flags)
+		# the child is already reaped if SIGCHLD is ignored
+		except ChildProcessError: 
+			return self.pid,0
+	def _internal_poll(self,*args,**kwargs):
+		kwargs['_waitpid'] = self._wait4
+		return super()._internal_poll(*args,**kwargs)
+
+def bash_metrics(proc,start):
+	"""
+	Report the wall time, CPU time, and peak memory for a finished BashPopen.
+	"""
+	usage = dict(wall=time.time()-start)
+	if proc.rusage is not None:
+		# ru_maxrss is in kilobytes on linux and bytes on macos
+		usage.update(user=proc.rusage.ru_utime,sys=proc.rusage.ru_stime,
+			maxrss=proc.rusage.ru_maxrss*(1 if sys.platform=='darwin' else 1024))
+	return usage
+
+# commands with these characters only can skip the shell. we exclude newlines
+#   and anything that bash expands, redirects, or uses to chain commands
+re_shell_free = re.compile(r'^[\w@%+=:,./\- \t\'"]+$')
+# keywords that also exist as programs but behave differently in bash
+bash_keywords = ['time','command','exec','builtin']
+
+def bash_argv(command):
+	"""
+	Return an argument list for a command that can run without a shell.
+	Lists are used as-is, while strings are split only if they are shell-free
+	and start with a program on the PATH, otherwise we return None.
+	"""
+	if isinstance(command,(list,tuple)): return [str(i) for i in command]
+	if not re_shell_free.match(command): return None
+	try: argv = shlex.split(command)
+	except ValueError: return None
+	# assignments, builtins, and relative paths (resolved from the cwd by the
+	#   shell) require the shell
+	if not argv or argv[0] in bash_keywords or '=' in argv[0]: return None
+	if '/' in argv[0] and not os.path.isabs(argv[0]): return None
+	if not command_cache.which(argv[0]): return None
+	return argv
+
+class BashTimeout(Exception):
+	pass
+
+def bash_kill_group(proc,grace=5):
+	"""
+	Kill the process group led by a process with SIGTERM and then SIGKILL.
+	"""
+	for sig in [signal.SIGTERM,signal.SIGKILL]:
+		try: os.killpg(proc.pid,sig)
+		except ProcessLookupError: return
+		# wait for every member of the group to exit before escalating
+		deadline = time.time()+grace
+		while time.time() < deadline:
+			# reap the leader so it does not stay in the group as a zombie
+			proc.poll()
+			try: os.killpg(proc.pid,0)
+			except ProcessLookupError: return
+			time.sleep(0.05)
+
+class BashWatchdog:
+	"""
+	Kill the process group of a command after a timeout.
+	"""
+	def __init__(self,timeout,grace=5):
+		self.timeout = timeout
+		self.grace = grace
+		self.expired = False
+		self.timer = None
+	def start(self,proc):
+		self.timer = threading.Timer(self.timeout,self.expire,args=[proc])
+		self.timer.daemon = True
+		self.timer.start()
+	def expire(self,proc):
+		self.expired = True
+		bash_kill_group(proc,grace=self.grace)
+	def cancel(self):
+		if self.timer: self.timer.cancel()
+
+def bash_rlimits(rlimits):
+	"""
+	Set resource limits in the child before it runs the command.
+	Send a dict of names e.g. cpu or as and a limit or a (soft,hard) pair.
+	"""
+	for name,limit in rlimits.items():
+		if not isinstance(limit,(tuple,list)):
+			limit = (limit,limit)
+		resource.setrlimit(getattr(resource,'RLIMIT_%s'%name.upper()),limit)
+
+# process groups started by bash in each thread so we can kill them if we are 
+#   interrupted. note that we cannot clean up if the parent is killed outright
+_bash_groups = threading.local()
+
+def bash_group_cleanup(func):
+	"""
+	Decorator to kill the process groups from an interrupted bash call.
+	"""
+	@functools.wraps(func)
+	def inner(*args,**kwargs):
+		stack = _bash_groups.__dict__.setdefault('stack',[])
+		stack.append([])
+		try: return func(*args,**kwargs)
+		except (KeyboardInterrupt,SystemExit):
+			for proc in stack[-1]:
+				bash_kill_group(proc,grace=1)
+			raise
+		finally: stack.pop()
+	return inner
+
+@bash_group_cleanup
 def bash(command,log=None,cwd=None,inpipe=None,scroll=True,tag=None,
-	local=False,scroll_log=True,permit_fail=False,announce=False,quiet=False):
+	local=False,scroll_log=True,permit_fail=False,announce=False,quiet=False,
+	capture='full',capture_lines=1000,metrics=False,
+	timeout=None,timeout_grace=5,group=None,rlimits=None,shell=None):
 	"""
 	Run a BASH command.
 	This function serves as a general interface to the shell.
 	There is no TTY so we cannot run an interactive docker session.
+	Use `capture` to bound the output held in memory (see BashCapture). Set
+	`metrics` to report the wall time, CPU time, and peak memory of the child
+	in the result, or send a path to also append them to a JSONL file. The 
+	`timeout` kills the process group of the command with SIGTERM and then
+	SIGKILL after `timeout_grace` seconds, and raises BashTimeout. The group 
+	is also killed if bash is interrupted. Send `rlimits` to limit the child
+	with a dict of resource names (e.g. cpu or as) and limits. Send a list
+	instead of a string to run the command without a shell. Simple strings
+	run without a shell by default (see bash_argv) unless `shell` is True.
 	"""
+	start = time.time()
+	# skipping the shell halves the cost of starting the command and lets
+	#   subprocess use vfork or posix_spawn, except with preexec_fn for rlimits
+	# the shell only reads the first argument so we quote and join a list
+	if shell and isinstance(command,(list,tuple)):
+		command = shlex.join([str(i) for i in command])
+	argv = None if shell else bash_argv(command)
+	if shell==False and argv is None:
+		raise Exception('cannot run without a shell: %s'%command)
+	# the command runs in its own process group when we might need to kill it
+	if group is None: group = bool(timeout)
+	watchdog = BashWatchdog(timeout,grace=timeout_grace) if timeout else None
+	def popen(*args,**kwargs):
+		if argv:
+			args = (argv,)+args[1:]
+			kwargs.update(shell=False,executable=None)
+		if group: 
+			kwargs['start_new_session'] = True
+		if rlimits: 
+			kwargs['preexec_fn'] = functools.partial(bash_rlimits,rlimits)
+		proc = BashPopen(*args,**kwargs)
+		if group: 
+			_bash_groups.stack[-1].append(proc)
+		if watchdog: 
+			watchdog.start(proc)
+		return proc
+	def check_timeout():
+		if watchdog:
+			watchdog.cancel()
+			if watchdog.expired and not permit_fail:
+				raise BashTimeout('bash command timed out after %ss: %s'%(
+					timeout,command))
 	if announce: 
 		print('status: ortho.bash%s runs command: %s'%(
 			' (at %s)'%cwd if cwd else '',str(command)))
@@ -88,11 +434,12 @@ def bash(command,log=None,cwd=None,inpipe=None,scroll=True,tag=None,
 		if log: log = os.path.relpath(log,cwd_local)
 		pwd = os.getcwd()
 		os.chdir(cwd_local)
+	captured = BashCapture(capture,lines=capture_lines)
 	if log == None: 
 		kwargs = dict(cwd=cwd,shell=True,executable='/bin/bash',
 			stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
 		if input: kwargs['stdin'] = subprocess.PIPE
-		proc = subprocess.Popen(command,**kwargs)
+		proc = popen(command,**kwargs)
 		if inpipe and scroll: raise Exception('cannot use inpipe with scrolling output')
 		if inpipe: 
 			# note that some solutions can handle input
@@ -101,7 +448,7 @@ def bash(command,log=None,cwd=None,inpipe=None,scroll=True,tag=None,
 		# no log and no input pipe
 		else: 
 			# collect stdout which receives stderr also
-			stdout,stderr = [],''
+			stdout,stderr = captured,''
 			# scroll option pipes output to the screen
 			if scroll:
 				empty = '' if sys.version_info<(3,0) else b''
@@ -109,12 +456,20 @@ def bash(command,log=None,cwd=None,inpipe=None,scroll=True,tag=None,
 						if not quiet: 
 							sys.stdout.write((tag if tag else '')+line.decode('utf-8'))
 							sys.stdout.flush()
-						stdout.append(line.decode('utf-8'))
+						captured.append(line.decode('utf-8'))
 				proc.wait()
+				check_timeout()
 				if proc.returncode and not permit_fail:
 					raise Exception('see above for error. bash return code %d'%
 						proc.returncode)
-				stdout = '\n'.join(stdout)
+				stdout = captured.join('\n')
+			# bounded capture reads in chunks since communicate holds everything
+			elif capture != 'full':
+				if proc.stdin: proc.stdin.close()
+				for lines in bash_stream_lines(proc.stdout):
+					captured.extend([line.decode('utf-8','replace') 
+						for line in lines])
+				stdout,stderr = captured.join(''),''
 			# no scroll waits for output and then checks it below
 			else: 
 				# these are strings not bytes
@@ -122,73 +477,66 @@ def bash(command,log=None,cwd=None,inpipe=None,scroll=True,tag=None,
 	# alternative scroll method via https://stackoverflow.com/questions/18421757
 	# special scroll is useful for some cases where buffered output was necessary
 	# this method can handle universal newlines while the threading method cannot
+	# we previously polled the log file every half second but now we forward 
+	#   each chunk from a pipe as soon as it arrives. the chunks are written
+	#   verbatim so carriage returns in progress lines behave as in a terminal
 	elif log and scroll=='special':
-		with io.open(log_abs,'wb') as writes, io.open(log_abs,'rb') as reads:
-			proc = subprocess.Popen(command,stdout=writes,
-				cwd=cwd,shell=True,universal_newlines=True)
-			while proc.poll() is None:
-				sys.stdout.write(reads.read().decode('utf-8'))
-				time.sleep(0.5)
-			# read the remaining
-			sys.stdout.write(reads.read().decode('utf-8'))
+		proc = popen(command,stdout=subprocess.PIPE,
+			cwd=cwd,shell=True,bufsize=0)
+		decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+		splitter = BashLineSplitter()
+		with io.open(log_abs,'wb') as writes, \
+			selectors.DefaultSelector() as sel:
+			sel.register(proc.stdout,selectors.EVENT_READ)
+			while True:
+				# background jobs can hold the pipe open after the child exits
+				#   so we stop once it exits and the pipe has no more data
+				if sel.select(timeout=0.05):
+					chunk = os.read(proc.stdout.fileno(),65536)
+				elif proc.poll() is not None: chunk = b''
+				else: continue
+				writes.write(chunk)
+				writes.flush()
+				sys.stdout.write(decoder.decode(chunk,final=not chunk))
+				sys.stdout.flush()
+				lines = splitter.feed(chunk) if chunk else splitter.close()
+				captured.extend([line.decode('utf-8','replace') 
+					for line in lines])
+				if not chunk: break
+		proc.stdout.close()
+		stdout,stderr = captured.join(''),''
 	# log to file and print to screen using the reader function above
 	elif log and scroll:
 		# via: https://stackoverflow.com/questions/31833897/
-		# note that this method also works if you remove output to a file
-		#   however I was not able to figure out how to identify which stream 
-		#   was which during iter, for obvious reasons
+		# we previously read each pipe in a thread that sent lines through a 
+		#   queue. now we read both pipes in a single loop with selectors
 		# note that this fails with weird newlines i.e. when GROMACS supplies
 		#   a "remaining wall clock time" and this problem cannot be overcome
 		#   by setting universal_newlines with this scroll method. recommend
 		#   that users instead try the special method above, which works fine
 		#   with unusual newlines
-		# with bufsize 1 we get: RuntimeWarning: line buffering (buffering=1) 
-		#   isn't supported in binary mode, the default buffer size will be used
-		proc = subprocess.Popen(command,cwd=cwd,shell=True,executable='/bin/bash',
+		proc = popen(command,cwd=cwd,shell=True,executable='/bin/bash',
 			stdout=subprocess.PIPE,stderr=subprocess.PIPE,bufsize=0)
-		qu = queue.Queue()
-		threading.Thread(target=reader,args=[proc.stdout,qu]).start()
-		threading.Thread(target=reader,args=[proc.stderr,qu]).start()
-		empty = '' if sys.version_info<(3,0) else b''
 		# collect stdout which receives stderr also
-		stdout,stderr = [],''
+		stderr = ''
 		log_abs_base = os.path.basename(log_abs)
 		with open(log_abs,'ab') as fp:
-			for _ in range(2):
-				for _,line in iter(qu.get,None):
-					# decode early, encode late
-					line_decode = line.decode('utf-8')
-					# note that sometimes we get a "\r\n" or "^M"-style newline
-					#   which makes the output appear inconsistent (some lines are prefixed) so we 
-					#   replace newlines, but only if we are also reporting the log file on the line next
-					#   to the output. this can get cluttered so you can turn off scroll_log if you want
-					if scroll_log:
-						line = re.sub('\r\n?',r'\n',line_decode)
-						line_subs = ['[LOG] %s | %s'%(log_abs_base,l.strip(' ')) 
-							for l in line.strip('\n').splitlines() if l] 
-						if not line_subs: continue
-						line_here = ('\n'.join(line_subs)+'\n')
-					else: line_here = re.sub('\r\n?',r'\n',line_decode)
-					# encode on the way out to the file, otherwise print
-					# note that the encode/decode events in this loop work for ascii and unicode in both
-					#   python 2 and 3, however python 2 (where we recommend importing unicode_literals) will
-					#   behave weird if you print from a script called through ortho.bash due to locale issues
-					#   described here: https://pythonhosted.org/kitchen/unicode-frustrations.html
-					#   so just port your unicode-printing python 2 code or use a codecs.getwriter
-					print(line_here,end='')
-					stdout.append(line_here)
-					# do not write the log file in the final line
-					fp.write(line.encode('utf-8'))
-		# protect against type issues
-		try: stdout = '\n'.join(stdout).decode()
-		except: stdout = '\n'.join(stdout)
+			for lines in bash_stream_lines(proc.stdout,proc.stderr):
+				lines,lines_here = bash_format_lines(lines,
+					log=log_abs_base if scroll_log else None)
+				# write each batch of lines at once to the screen and log
+				sys.stdout.write(''.join(lines_here))
+				sys.stdout.flush()
+				captured.extend(lines_here)
+				fp.write(''.join(lines).encode('utf-8'))
+		stdout = captured.join('\n')
 	# log to file and suppress output
 	elif log and not scroll:
 		output = open(log_abs,'w')
 		kwargs = dict(cwd=cwd,shell=True,executable='/bin/bash',
 			stdout=output,stderr=output)
 		if inpipe: kwargs['stdin'] = subprocess.PIPE
-		proc = subprocess.Popen(command,**kwargs)
+		proc = popen(command,**kwargs)
 		if not inpipe: stdout,stderr = proc.communicate()
 		else: stdout,stderr = proc.communicate(input=inpipe.encode('utf-8'))
 	else: raise Exception('invalid options')
@@ -200,6 +548,13 @@ def bash(command,log=None,cwd=None,inpipe=None,scroll=True,tag=None,
 	# note that putting wait here means that you get a log file with the error 
 	#   along a standard traceback to the location of the bash call
 	proc.wait()
+	check_timeout()
+	if metrics:
+		usage = bash_metrics(proc,start)
+		if isinstance(metrics,(str,os.PathLike)):
+			with open(metrics,'a') as fp:
+				fp.write(json.dumps(dict(command=str(command),cwd=cwd,
+					code=proc.returncode,when=start,**usage))+'\n')
 	if proc.returncode: 
 		if log and not permit_fail: 
 			raise Exception('bash error, see %s'%log_abs)
@@ -226,25 +581,322 @@ def bash(command,log=None,cwd=None,inpipe=None,scroll=True,tag=None,
 			# protect against type issues
 			try: stdout = stdout.decode('utf-8')
 			except: pass
-	return DotDict(**{'stdout':stdout,'stderr':stderr,'code':proc.returncode})
+			# communicate holds the entire output so we apply the policy after
+			if capture != 'full' and (inpipe or log):
+				captured.extend(stdout.splitlines(keepends=True))
+				stdout = captured.join('')
+	result = DotDict(**{'stdout':stdout,'stderr':stderr,'code':proc.returncode,
+		'capture':capture,'dropped':captured.dropped})
+	if metrics: result['metrics'] = usage
+	if watchdog: result['timeout'] = watchdog.expired
+	return result
+
+async def bash_async(command,log=None,cwd=None,scroll=True,tag=None,
+	scroll_log=True,permit_fail=False,announce=False,quiet=False,
+	capture='full',capture_lines=1000,chunk_size=65536):
+	"""
+	Run a BASH command with asyncio.
+	This is the asynchronous counterpart to bash and supports the same log, 
+	scroll, tag, capture, and permit_fail options so you can run many commands 
+	at once.
+	"""
+	if announce: 
+		print('status: ortho.bash_async%s runs command: %s'%(
+			' (at %s)'%cwd if cwd else '',str(command)))
+	cwd = os.path.abspath(os.path.expanduser(cwd if cwd else '.'))
+	# the log path is relative to the cwd, as in bash
+	if log: log_abs = os.path.abspath(os.path.join(cwd,os.path.expanduser(log)))
+	else: log_abs = None
+	collected = BashCapture(capture,lines=capture_lines)
+	if log and not scroll:
+		with open(log_abs,'w') as output:
+			proc = await asyncio.create_subprocess_shell(command,cwd=cwd,
+				executable='/bin/bash',stdout=output,stderr=output)
+			await proc.wait()
+		stdout,stderr = None,None
+	else:
+		proc = await asyncio.create_subprocess_shell(command,cwd=cwd,
+			executable='/bin/bash',stdout=asyncio.subprocess.PIPE,
+			stderr=asyncio.subprocess.PIPE if log else asyncio.subprocess.STDOUT)
+		# collect stdout which receives stderr also
+		fp = open(log_abs,'ab') if log else None
+		log_base = os.path.basename(log_abs) if log and scroll_log else None
+		async def pump(stream):
+			splitter = BashLineSplitter()
+			while True:
+				chunk = await stream.read(chunk_size)
+				lines = splitter.feed(chunk) if chunk else splitter.close()
+				if lines:
+					if not scroll:
+						collected.extend([line.decode('utf-8') for line in lines])
+					elif log:
+						lines,lines_here = bash_format_lines(lines,log=log_base)
+						sys.stdout.write(''.join(lines_here))
+						sys.stdout.flush()
+						collected.extend(lines_here)
+						fp.write(''.join(lines).encode('utf-8'))
+					else:
+						lines = [line.decode('utf-8') for line in lines]
+						if not quiet:
+							sys.stdout.write(''.join(
+								(tag if tag else '')+line for line in lines))
+							sys.stdout.flush()
+						collected.extend(lines)
+				if not chunk: break
+		try:
+			await asyncio.gather(*[pump(stream) for stream in 
+				[proc.stdout,proc.stderr] if stream is not None])
+			await proc.wait()
+		finally:
+			if fp: fp.close()
+		# no scroll returns the output verbatim while scroll joins lines
+		stdout = collected.join('' if not scroll else '\n')
+		stderr = '' if scroll else None
+	if proc.returncode: 
+		if log and not permit_fail: 
+			raise Exception('bash error, see %s'%log_abs)
+		elif not permit_fail:
+			if stdout:
+				print('error','stdout:')
+				print(stdout.strip('\n'))
+			raise Exception(('bash error with returncode %d and '
+				'stdout/stderr printed above')%proc.returncode)
+	return DotDict(**{'stdout':stdout,'stderr':stderr,'code':proc.returncode,
+		'capture':capture,'dropped':collected.dropped})
 
-class TeeMultiplexer:
+async def bash_gather(commands,limit=None,**kwargs):
+	"""
+	Run many commands with bash_async and at most `limit` at once.
+	Send a list of commands or a dict of names and commands. Each command gets
+	a tag with its name or index so the output from each is prefixed. Returns
+	results in the same order or a dict. Failures return exceptions in place 
+	of results when permit_fail is not set.
+	"""
+	named = (list(commands.items()) if isinstance(commands,dict) 
+		else list(enumerate(commands)))
+	semaphore = asyncio.Semaphore(limit if limit else len(named) or 1)
+	async def run(name,command):
+		kwargs_this = dict(kwargs)
+		kwargs_this.setdefault('tag','[%s] '%name)
+		async with semaphore:
+			return await bash_async(command,**kwargs_this)
+	results = await asyncio.gather(*[run(name,command) 
+		for name,command in named],return_exceptions=True)
+	if isinstance(commands,dict):
+		return dict(zip(commands.keys(),results))
+	return results
+
+def bash_many(commands,workers=None,log_dir='.',fail_fast=False,**kwargs):
+	"""
+	Run many commands with bash in a pool of at most `workers` threads.
+	Send a list of commands or a dict of names and commands. Each command writes
+	a log file in `log_dir` named for the command, and scrolling output is 
+	tagged with that name. With `fail_fast` we cancel pending commands and 
+	raise on the first failure, otherwise we collect every result. Returns a 
+	dict of DotDict results with the code, error, log, and time.
+	"""
+	named = (list(commands.items()) if isinstance(commands,dict) 
+		else [('command-%d'%num,command) 
+			for num,command in enumerate(commands)])
+	if not workers:
+		workers = get_cpu_cores()
+	log_dir = os.path.abspath(os.path.expanduser(log_dir))
+	def run(name,command):
+		log = os.path.join(log_dir,'%s.log'%name)
+		start = time.time()
+		try: 
+			result = bash(command,log=log,permit_fail=True,**kwargs)
+			code,stdout = result.code,result.stdout
+			error = ('bash error with returncode %d, see %s'%(code,log) 
+				if code else None)
+		except Exception as e:
+			code,stdout,error = None,None,str(e)
+		return DotDict(name=name,command=command,log=log,code=code,
+			stdout=stdout,error=error,time=time.time()-start)
+	results = {}
+	with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+		jobs = dict([(pool.submit(run,name,command),name) 
+			for name,command in named])
+		for job in concurrent.futures.as_completed(jobs):
+			result = job.result()
+			results[result.name] = result
+			if fail_fast and result.error:
+				for other in jobs: other.cancel()
+				raise Exception('bash_many stopped on %s: %s'%(
+					result.name,result.error))
+	# return the results in the order of the commands
+	return dict([(name,results[name]) for name,_ in named])
+
+class ShellSession:
+	"""
+	Run many commands in one long-lived bash process.
+	Use this as a context manager so that expensive environment setup (e.g.
+	loading modules or activating an environment) happens once. Each command
+	runs with eval in the same shell, so cd and export persist, and we frame
+	the output with a sentinel to collect stdout, stderr, and the exit code.
+	"""
+	def __init__(self,setup=None,cwd=None,env=None,executable='/bin/bash'):
+		self.sentinel = ('__ortho_session_%s__'%os.urandom(8).hex()).encode()
+		self.proc = BashPopen([executable],cwd=cwd,env=env,
+			stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=subprocess.PIPE,
+			bufsize=0,start_new_session=True)
+		if setup: 
+			try: self.run(setup)
+			except:
+				self.close(grace=1)
+				raise
+	def __enter__(self):
+		return self
+	def __exit__(self,*args):
+		self.close()
+	def send(self,command):
+		"""Send a command followed by the sentinels."""
+		# commands cannot read from our stdin, which carries the commands
+		script = ('eval %s < /dev/null\n'
+			'printf "\\n%%s %%d\\n" %s $?\n'
+			'printf "\\n%%s\\n" %s >&2\n')%(shlex.quote(command),
+			self.sentinel.decode(),self.sentinel.decode())
+		try: 
+			self.proc.stdin.write(script.encode('utf-8'))
+			self.proc.stdin.flush()
+		except BrokenPipeError: 
+			raise Exception('shell session has exited')
+	def receive(self,timeout=None):
+		"""Read both pipes until each one ends with a sentinel."""
+		ends = {self.proc.stdout:re.compile(
+				b'\n'+re.escape(self.sentinel)+b' (\\d+)\n$'),
+			self.proc.stderr:re.compile(b'\n'+re.escape(self.sentinel)+b'\n$')}
+		buffers = dict([(pipe,bytearray()) for pipe in ends])
+		found = {}
+		deadline = time.time()+timeout if timeout else None
+		with selectors.DefaultSelector() as sel:
+			for pipe in ends: sel.register(pipe,selectors.EVENT_READ)
+			while sel.get_map():
+				wait = max(deadline-time.time(),0) if deadline else None
+				events = sel.select(wait)
+				if not events:
+					bash_kill_group(self.proc,grace=1)
+					self.close()
+					raise BashTimeout('shell session timed out after %ss'%
+						timeout)
+				for key,_ in events:
+					pipe = key.fileobj
+					chunk = os.read(pipe.fileno(),65536)
+					if not chunk: 
+						self.close()
+						raise Exception('shell session has exited')
+					buffers[pipe].extend(chunk)
+					# the sentinel is always the last thing in each pipe
+					tail = bytes(buffers[pipe][-len(self.sentinel)-32:])
+					match = ends[pipe].search(tail)
+					if match: 
+						found[pipe] = match
+						del buffers[pipe][len(buffers[pipe])-len(tail)+
+							match.start():]
+						sel.unregister(pipe)
+		return (buffers[self.proc.stdout].decode('utf-8'),
+			buffers[self.proc.stderr].decode('utf-8'),
+			int(found[self.proc.stdout].group(1)))
+	def run(self,command,permit_fail=False,timeout=None):
+		"""
+		Run a command in the session and return stdout, stderr, and the code.
+		A timeout kills the session since we cannot tell where it stopped.
+		"""
+		if self.proc.poll() is not None:
+			raise Exception('shell session has exited')
+		self.send(command)
+		stdout,stderr,code = self.receive(timeout=timeout)
+		if code and not permit_fail:
+			raise Exception('bash error with returncode %d in shell session: '
+				'%s\nstderr: %s'%(code,command,stderr.strip('\n')))
+		return DotDict(stdout=stdout,stderr=stderr,code=code)
+	def close(self,grace=5):
+		"""End the shell and anything it started."""
+		if self.proc.poll() is None:
+			try: 
+				self.proc.stdin.close()
+				self.proc.wait(timeout=grace)
+			except (BrokenPipeError,subprocess.TimeoutExpired): pass
+		bash_kill_group(self.proc,grace=grace)
+		for pipe in [self.proc.stdin,self.proc.stdout,self.proc.stderr]:
+			if not pipe.closed: pipe.close()
+		self.proc.wait()
+
+class TeeMultiplexer(io.TextIOBase):
 	"""
 	Send stdout to file via: `stdout_prev = sys.stdout;sys.stdout = tee(stdout_prev,open('log','w'))`
 	You must set the tee flag in config.json to write this file.
+	The buffered mode writes to the first stream (the screen) immediately and
+	sends text for the second stream (the log) through a bounded queue to a 
+	writer thread, which flushes it every `flush_interval` seconds.
 	"""
 	# via: http://shallowsky.com/blog/programming/python-tee.html
-	def __init__(self,_fd1,_fd2):
+	def __init__(self,_fd1,_fd2,buffered=False,queue_size=10000,
+		flush_interval=1.0):
+		super().__init__()
 		self.fd1,self.fd2 = _fd1,_fd2
-	def __del__(self):
-		if self.fd1 != sys.stdout and self.fd1 != sys.stderr : self.fd1.close()
-		if self.fd2 != sys.stdout and self.fd2 != sys.stderr : self.fd2.close()
+		self.buffered = buffered
+		self.flush_interval = flush_interval
+		self.writer = None
+		if buffered:
+			self.queue = queue.Queue(maxsize=queue_size)
+			self.writer = threading.Thread(target=self._writer,daemon=True)
+			self.writer.start()
+			# the writer is a daemon so we drain the queue on exit
+			atexit.register(self.flush)
+	# marker sent through the queue to request a flush
+	_flush = object()
+	def _writer(self):
+		"""Write queued text to the second stream until we receive None."""
+		last = time.time()
+		while True:
+			# flush periodically when idle
+			try: item = self.queue.get(timeout=self.flush_interval)
+			except queue.Empty:
+				self.fd2.flush()
+				last = time.time()
+				continue
+			try:
+				if item is None: return
+				if item is not self._flush: self.fd2.write(item)
+				if item is self._flush or time.time()-last>self.flush_interval:
+					self.fd2.flush()
+					last = time.time()
+			finally: self.queue.task_done()
+	def writable(self):
+		return True
+	def isatty(self):
+		return self.fd1.isatty()
+	def fileno(self):
+		return self.fd1.fileno()
+	@property
+	def encoding(self):
+		return getattr(self.fd1,'encoding',None)
 	def write(self,text):
+		if self.closed: raise ValueError('I/O operation on closed file')
 		self.fd1.write(text)
-		self.fd2.write(text)
+		if self.buffered: self.queue.put(text)
+		else: self.fd2.write(text)
+		return len(text)
 	def flush(self):
+		if self.closed: return
 		self.fd1.flush()
-		self.fd2.flush()
+		if self.buffered and self.writer.is_alive():
+			# the writer flushes when it reaches this marker
+			self.queue.put(self._flush)
+			self.queue.join()
+		else: self.fd2.flush()
+	def close(self):
+		if self.closed: return
+		self.flush()
+		if self.buffered:
+			self.queue.put(None)
+			self.writer.join()
+			atexit.unregister(self.flush)
+		# the base class flushes so we close it before the files
+		super().close()
+		if self.fd1 != sys.stdout and self.fd1 != sys.stderr : self.fd1.close()
+		if self.fd2 != sys.stdout and self.fd2 != sys.stderr : self.fd2.close()
 
 def bash_basic(cmd,cwd=None,log=None,announce=False):
 	"""
@@ -445,17 +445,16 @@ class Dispatcher:
 		self.container = target_cls()
 	def __call__(self,*args,**kwargs):
 		# the following sequence is nearly verbatim from Dispatcher.__init__
-		# store the incoming arguments
-		self._args = args
-		self._kwargs = kwargs
+		# note that we use locals and not attributes so that one instance can
+		#   dispatch from several threads at once
 		# collect methods
-		self._methods = dict([(i,j) for i,j in 
+		methods = dict([(i,j) for i,j in 
 			inspect.getmembers(self.container,predicate=inspect.ismethod)
 			if not i.startswith('_')])
 		# identify a match
 		matches = []
-		for name,func in self._methods.items():
-			if function_accepts_args(func,*self._args,**self._kwargs):
+		for name,func in methods.items():
+			if function_accepts_args(func,*args,**kwargs):
 				matches.append(name)
 		if not matches:
 			raise Exception(('this subclass of Dispatcher (%s) does not have '
@@ -465,8 +464,8 @@ class Dispatcher:
 		elif len(matches)>1:
 			raise NotImplementedError('redundant matches in Dispatcher class '
 				f'({self.container.__class__.__name__}): %s'%str(matches))
-		else: self._target = matches[0]
-		method_builder = getattr(self.container,self._target)
+		else: target = matches[0]
+		method_builder = getattr(self.container,target)
 		result = method_builder(*args,**kwargs)
 		return result
 
@@ -477,17 +476,16 @@ class DispatcherFuzz:
 		self.container = target_cls()
 	def __call__(self,*args,**kwargs):
 		# the following sequence is nearly verbatim from Dispatcher.__init__
-		# store the incoming arguments
-		self._args = args
-		self._kwargs = kwargs
+		# note that we use locals and not attributes so that one instance can
+		#   dispatch from several threads at once
 		# collect methods
-		self._methods = dict([(i,j) for i,j in 
+		methods = dict([(i,j) for i,j in 
 			inspect.getmembers(self.container,predicate=inspect.ismethod)
 			if not i.startswith('_')])
 		unknowns = {}
-		for name,func in self._methods.items():
+		for name,func in methods.items():
 			sig = introspect_function(func)
-			unknown_kwargs = signature_match_fuzz(sig,*self._args,**self._kwargs)
+			unknown_kwargs = signature_match_fuzz(sig,*args,**kwargs)
 			if unknown_kwargs == -1: 
 				continue
 			else:
@@ -505,7 +503,7 @@ class DispatcherFuzz:
 			if len(min_where) == 0:
 				raise AssertionError
 			elif len(min_where) == 1:
-				self._target = min_where[0]
+				target = min_where[0]
 			else:
 				raise Exception(('this fuzzy subclass of Dispatcher (%s) does '
 					'not have any functions capable of accepting the arguments '
@@ -516,7 +514,7 @@ class DispatcherFuzz:
 						str(args),str(kwargs),
 						str(unknowns)))
 
-		method_builder = getattr(self.container,self._target)
+		method_builder = getattr(self.container,target)
 		result = method_builder(*args,**kwargs)
 		return result
 
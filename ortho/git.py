@@ -3,17 +3,157 @@
 
 import re
 import os
+import subprocess
+import concurrent.futures
 from .bash import bash
+from .dotdict import DotDict
+
+def git_dir_find(path):
+	"""
+	Find the git directory of a repository.
+	Returns None when .git is not a directory, e.g. for worktrees.
+	"""
+	git_dir = os.path.join(path,'.git')
+	if os.path.isdir(git_dir): return git_dir
+	return None
+
+def git_read_ref(git_dir,ref):
+	"""Resolve a ref from a loose ref file or the packed refs."""
+	try:
+		with open(os.path.join(git_dir,ref)) as fp: 
+			sha = fp.read().strip()
+		# symbolic refs other than HEAD are unusual so we leave them to git
+		return None if sha.startswith('ref:') else sha
+	except (FileNotFoundError,NotADirectoryError): pass
+	try:
+		with open(os.path.join(git_dir,'packed-refs')) as fp:
+			for line in fp:
+				if line.startswith(('#','^')): continue
+				sha,_,name = line.rstrip('\n').partition(' ')
+				if name == ref: return sha
+	except FileNotFoundError: pass
+	return None
+
+def git_read_head(path):
+	"""
+	Read the hash and branch at HEAD from the files in the git directory.
+	Returns None when we cannot, in which case you should ask git.
+	"""
+	git_dir = git_dir_find(path)
+	if not git_dir: return None
+	try:
+		with open(os.path.join(git_dir,'HEAD')) as fp: 
+			head = fp.read().strip()
+	except OSError: return None
+	if head.startswith('ref: '):
+		ref = head[len('ref: '):]
+		sha = git_read_ref(git_dir,ref)
+		# an unborn branch has no hash
+		if not sha: return None
+		branch = re.sub('^refs/heads/','',ref)
+		return DotDict(hash=sha,branch=branch)
+	# a detached HEAD holds the hash
+	elif re.match('^[0-9a-f]{40}([0-9a-f]{24})?$',head): 
+		return DotDict(hash=head,branch=None)
+	return None
+
+def git_command(path,*args):
+	"""Run a git command quietly and return stdout or None if it fails."""
+	proc = subprocess.run(['git','-C',path]+list(args),
+		stdout=subprocess.PIPE,stderr=subprocess.DEVNULL)
+	if proc.returncode: return None
+	return proc.stdout.decode('utf-8')
+
+def git_status(path,dirty=True,upstream=True):
+	"""
+	Collect the hash, branch, dirty state, and commits ahead of and behind the
+	upstream branch for a repository without using the network. 
+	Note that the upstream counts use the remote-tracking refs from the last
+	fetch, and the dirty state ignores untracked files.
+	"""
+	head = git_read_head(path)
+	if not head:
+		sha = git_command(path,'rev-parse','HEAD')
+		branch = git_command(path,'symbolic-ref','--short','-q','HEAD')
+		head = DotDict(hash=sha.strip() if sha else None,
+			branch=branch.strip() if branch else None)
+	status = DotDict(path=path,hash=head.hash,branch=head.branch,
+		dirty=None,ahead=None,behind=None)
+	if dirty:
+		stdout = git_command(path,'status','--porcelain','--untracked-files=no')
+		if stdout is not None: status.dirty = bool(stdout.strip())
+	if upstream and status.branch:
+		stdout = git_command(path,'rev-list','--count','--left-right',
+			'HEAD...@{upstream}')
+		if stdout: status.ahead,status.behind = map(int,stdout.split())
+	return status
+
+def git_status_many(paths,workers=8,**kwargs):
+	"""
+	Collect git_status for many repositories in parallel.
+	Returns a dict of results for each path.
+	"""
+	paths = list(paths)
+	with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+		return dict(zip(paths,pool.map(
+			lambda path: git_status(path,**kwargs),paths)))
 
 def get_git_hash(path):
 	"""
 	Collect the git hash.
 	"""
-	result = bash(f'git -C {path} rev-parse HEAD',quiet=True)
+	result = bash(['git','-C',path,'rev-parse','HEAD'],quiet=True)
 	return result['stdout'].strip()
 
-def code_current(source,path,branch=None,strict=True):
-	"""Check or clone the source code."""
+# cache for get_git_hash_cached keyed by the absolute path to the repository
+git_head_cache = {}
+
+def git_head_stamps(git_dir,ref=None):
+	"""
+	Identify the state of the files that determine HEAD.
+	Git replaces ref files by renaming so we include the inode with the time.
+	"""
+	stamps = []
+	for name in ['HEAD','packed-refs']+([ref] if ref else []):
+		try: 
+			stat = os.stat(os.path.join(git_dir,name))
+			stamps.append((stat.st_mtime_ns,stat.st_size,stat.st_ino))
+		except OSError: stamps.append(None)
+	return tuple(stamps)
+
+def get_git_hash_cached(path):
+	"""
+	Collect the git hash from a cache that we check against the ref files.
+	We fall back to get_git_hash for worktrees and other unusual layouts.
+	"""
+	key = os.path.abspath(path)
+	entry = git_head_cache.get(key)
+	if entry:
+		git_dir,ref,stamps,sha = entry
+		if git_head_stamps(git_dir,ref) == stamps: return sha
+	git_dir = git_dir_find(key)
+	if git_dir:
+		try:
+			with open(os.path.join(git_dir,'HEAD')) as fp: 
+				head = fp.read().strip()
+		except OSError: head = ''
+		ref = head[len('ref: '):] if head.startswith('ref: ') else None
+		# check the files before reading them so a change in between is 
+		#   caught on the next lookup
+		stamps = git_head_stamps(git_dir,ref)
+		result = git_read_head(key)
+		if result:
+			git_head_cache[key] = (git_dir,ref,stamps,result.hash)
+			return result.hash
+	git_head_cache.pop(key,None)
+	return get_git_hash(path)
+
+def code_current(source,path,branch=None,strict=True,offline=False):
+	"""
+	Check or clone the source code.
+	Use `offline` to compare with the remote-tracking branch from the last 
+	fetch instead of asking the remote.
+	"""
 	path_abs = os.path.abspath(path)
 	# if the path is absent we clone
 	if not os.path.isdir(path):
@@ -30,10 +170,14 @@ def code_current(source,path,branch=None,strict=True):
 		if branch and branch != branch_active:
 			raise NotImplementedError('dev: code_current can only check the branch, not switch it. '
 				f'note: branch={branch}, branch_active={branch_active}')
-		# via: https://stackoverflow.com/a/52307619/3313859
-		result = bash(f'git -C {path} remote show origin',
-			permit_fail=True,quiet=True)
-		if re.findall('local out of date',result['stdout']):
+		if offline: 
+			out_of_date = bool(git_status(path,dirty=False).behind)
+		else:
+			# via: https://stackoverflow.com/a/52307619/3313859
+			result = bash(f'git -C {path} remote show origin',
+				permit_fail=True,quiet=True)
+			out_of_date = bool(re.findall('local out of date',result['stdout']))
+		if out_of_date:
 			if not strict:
 				print('warning: your code (%s) is out of date'%path)
 			else:
@@ -9,6 +9,8 @@ import time
 import os
 import fcntl
 import errno
+import random
+import threading
 import datetime as dt
 import copy
 import json
@@ -30,15 +32,36 @@ class SimpleFlock:
 	# later found updates when this started failing on rockfish and this 
 	#   prompted me to set the open mode
 	# via: https://gist.github.com/jirihnidek/430d45c54311661b47fb45a3a7846537
-	def __init__(self,path,timeout=None):
+	# the wait times for all locks in this process
+	metrics = dict(acquired=0,timeouts=0,wait=0.,wait_max=0.)
+	metrics_lock = threading.Lock()
+	def __init__(self,path,timeout=None,poll=0.5,poll_min=0.001):
 		self.path = path
 		self.timeout = timeout
+		# we back off from poll_min to poll seconds between attempts
+		self.poll = poll
+		self.poll_min = poll_min
 		self.fd = None
-	def __enter__(self):
-		open_mode = os.O_RDWR | os.O_CREAT | os.O_TRUNC
-		self.fd = os.open(self.path,open_mode)
-		start_t = time.time()
+		self.wait = None
+		self.attempts = 0
+	@classmethod
+	def record(cls,wait,timeout=False):
+		"""Add the wait time for one lock to the metrics."""
+		with cls.metrics_lock:
+			if timeout: cls.metrics['timeouts'] += 1
+			else: cls.metrics['acquired'] += 1
+			cls.metrics['wait'] += wait
+			cls.metrics['wait_max'] = max(cls.metrics['wait_max'],wait)
+	def _lock(self,start_t):
+		"""Lock the open file or raise when we exceed the timeout."""
+		# without a timeout we block and the kernel wakes us when it is free
+		if self.timeout is None:
+			self.attempts += 1
+			fcntl.flock(self.fd,fcntl.LOCK_EX)
+			return
+		interval = self.poll_min
 		while True:
+			self.attempts += 1
 			try:
 				fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
 				# lock acquired
@@ -47,19 +70,46 @@ class SimpleFlock:
 				# resource temporarily unavailable
 				if ex.errno != errno.EAGAIN: 
 					raise
-				elif (self.timeout is not None and 
-					time.time() > (start_t + self.timeout)):
+				remaining = start_t+self.timeout-time.time()
+				if remaining <= 0:
 					# exceeded timeout
 					raise
-			# arbitrary sleep interval
-			time.sleep(0.5)
+			# exponential backoff with jitter so waiters do not retry together
+			time.sleep(min(random.uniform(0,interval),remaining))
+			interval = min(interval*2,self.poll)
+	def __enter__(self):
+		open_mode = os.O_RDWR | os.O_CREAT | os.O_TRUNC
+		start_t = time.time()
+		self.attempts = 0
+		while True:
+			self.fd = os.open(self.path,open_mode)
+			try: self._lock(start_t)
+			except (OSError,IOError) as ex:
+				os.close(self.fd)
+				self.fd = None
+				if ex.errno == errno.EAGAIN:
+					self.record(time.time()-start_t,timeout=True)
+				raise
+			# the holder unlinks the file when it exits, so we try again if the
+			#   file we locked is no longer the one at the path
+			try: 
+				stat,fstat = os.stat(self.path),os.fstat(self.fd)
+				current = (stat.st_dev,stat.st_ino)==(fstat.st_dev,fstat.st_ino)
+			except FileNotFoundError: current = False
+			if current: break
+			os.close(self.fd)
+		self.wait = time.time()-start_t
+		self.record(self.wait)
+		return self
 	def __exit__(self, *args):
-		fcntl.flock(self.fd, fcntl.LOCK_UN)
-		os.close(self.fd)
-		self.fd = None
 		# low effort unlocking
+		# we remove the file while we hold the lock so that waiters on the old
+		#   file can tell that it is gone
 		try: os.unlink(self.path)
 		except: pass
+		fcntl.flock(self.fd, fcntl.LOCK_UN)
+		os.close(self.fd)
+		self.fd = None
 
 # yaml is an optional handler below
 # dev: generalize the reader/writer for the state
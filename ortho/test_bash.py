@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# vim: noet:ts=4:sts=4:sw=4
+
+import io
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import contextlib
+import tempfile
+import unittest
+
+from .bash import bash
+from .bash import BashTimeout
+from .bash import bash_argv
+from .bash import command_check
+from .bash import command_check_warm
+from .bash import command_cache
+from .bash import bash_async
+from .bash import bash_gather
+from .bash import bash_many
+from .bash import ShellSession
+from .bash import TeeMultiplexer
+
+class TestBash(unittest.TestCase):
+	"""
+	Test the interface to the shell.
+	"""
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.log = os.path.join(self.tmpdir.name,'run.log')
+	def tearDown(self):
+		self.tmpdir.cleanup()
+	def test_bash_basic(self):
+		result = bash('echo hello',scroll=False)
+		self.assertEqual((result.stdout,result.code),('hello\n',0))
+	def test_bash_log_scroll(self):
+		stdout = io.StringIO()
+		with contextlib.redirect_stdout(stdout):
+			result = bash('echo hello; printf "a\\rb\\n"; echo "  c  "',
+				log=self.log)
+		lines = ['[LOG] run.log | %s\n'%i for i in ['hello','a','b','c']]
+		self.assertEqual(stdout.getvalue(),''.join(lines))
+		self.assertEqual(result.stdout,lines[0]+'\n'+''.join(lines[1:3])+
+			'\n'+lines[3])
+		with open(self.log) as fp:
+			self.assertEqual(fp.read(),'hello\na\nb\n  c  \n')
+	def test_bash_log_scroll_stderr(self):
+		with contextlib.redirect_stdout(io.StringIO()):
+			bash('echo out; echo err >&2',log=self.log)
+		with open(self.log) as fp:
+			self.assertEqual(sorted(fp.read().split()),['err','out'])
+	def test_bash_capture(self):
+		lines = ['%d\n'%i for i in range(1,101)]
+		with contextlib.redirect_stdout(io.StringIO()):
+			tail = bash('seq 1 100',capture='tail',capture_lines=5)
+			head_tail = bash('seq 1 100',capture='head_tail',capture_lines=2)
+			none = bash('seq 1 100',capture='none',log=self.log)
+		self.assertEqual((tail.capture,tail.dropped),('tail',95))
+		self.assertEqual(tail.stdout,'\n'.join(lines[-5:]))
+		self.assertEqual(head_tail.stdout,'\n'.join(lines[:2]+lines[-2:]))
+		self.assertEqual((none.stdout,none.dropped),('',100))
+		# the log file is always complete
+		with open(self.log) as fp:
+			self.assertEqual(fp.read(),''.join(lines))
+	def test_bash_capture_no_scroll(self):
+		import tracemalloc
+		# about 30MB of output is read in chunks and never held at once
+		command = ('%s -c "import sys; [sys.stdout.write(\'x\'*999+\'\\n\') '
+			'for _ in range(30000)]"'%sys.executable)
+		tracemalloc.start()
+		try: result = bash(command,scroll=False,capture='tail',capture_lines=3)
+		finally:
+			peak = tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+		self.assertLess(peak,5*2**20)
+		self.assertEqual(result.stdout,('x'*999+'\n')*3)
+		self.assertEqual(result.dropped,29997)
+	def test_bash_special_latency(self):
+		# the special scroll method once polled the log every half second
+		start = time.time()
+		with contextlib.redirect_stdout(io.StringIO()) as stdout:
+			result = bash('printf "10%%\\r20%%\\rdone\\n"',
+				log=self.log,scroll='special')
+		self.assertLess(time.time()-start,0.25)
+		self.assertEqual(stdout.getvalue(),'10%\r20%\rdone\n')
+		self.assertEqual(result.stdout,'10%\r20%\rdone\n')
+		with open(self.log) as fp:
+			self.assertEqual(fp.read(),'10%\n20%\ndone\n')
+	def test_bash_special_background(self):
+		# a background job that holds stdout does not keep us waiting
+		start = time.time()
+		with contextlib.redirect_stdout(io.StringIO()):
+			result = bash('sleep 3 & echo hi',log=self.log,scroll='special')
+		self.assertLess(time.time()-start,1)
+		self.assertEqual(result.stdout,'hi\n')
+	def test_bash_metrics(self):
+		path = os.path.join(self.tmpdir.name,'metrics.jsonl')
+		command = ('%s -c "x = bytearray(50*2**20); sum(range(10**6))"'%
+			sys.executable)
+		for kwargs in [dict(scroll=False),dict(log=self.log)]:
+			with contextlib.redirect_stdout(io.StringIO()):
+				result = bash(command,metrics=path,**kwargs)
+			self.assertGreater(result.metrics['maxrss'],50*2**20)
+			self.assertGreater(result.metrics['user'],0)
+			self.assertGreater(result.metrics['wall'],0)
+		with open(path) as fp:
+			records = [json.loads(line) for line in fp]
+		self.assertEqual([i['command'] for i in records],[command]*2)
+	def test_bash_timeout(self):
+		import psutil
+		pidfile = os.path.join(self.tmpdir.name,'pid')
+		# the grandchild ignores SIGTERM so the timeout must escalate
+		command = ('(trap "" TERM; echo $BASHPID > %s; sleep 30) & wait'%
+			pidfile)
+		start = time.time()
+		with contextlib.redirect_stdout(io.StringIO()):
+			with self.assertRaises(BashTimeout):
+				bash(command,log=self.log,timeout=0.5,timeout_grace=0.5)
+		self.assertLess(time.time()-start,5)
+		with open(pidfile) as fp:
+			pid = int(fp.read())
+		# the grandchild is killed but might take a moment to become a zombie
+		def gone():
+			try: return psutil.Process(pid).status()==psutil.STATUS_ZOMBIE
+			except psutil.NoSuchProcess: return True
+		deadline = time.time()+2
+		while not gone() and time.time()<deadline: time.sleep(0.05)
+		self.assertTrue(gone())
+	def test_bash_timeout_permit_fail(self):
+		result = bash('sleep 30',scroll=False,timeout=0.2,permit_fail=True)
+		self.assertTrue(result.timeout)
+		self.assertEqual(result.code,-signal.SIGTERM)
+	def test_bash_rlimits(self):
+		result = bash('ulimit -t',scroll=False,rlimits={'cpu':7})
+		self.assertEqual(result.stdout,'7\n')
+	def test_bash_argv(self):
+		# argv lists skip the shell so arguments need no quoting
+		result = bash(['echo','$HOME','a  b'],scroll=False)
+		self.assertEqual(result.stdout,'$HOME a  b\n')
+		self.assertEqual(bash_argv('git -C "a b" rev-parse HEAD'),
+			['git','-C','a b','rev-parse','HEAD'])
+		for command in ['echo $HOME','cd /tmp','ls *','a=1 env','time ls',
+			'echo a; echo b','echo a\necho b','./run.sh']:
+			self.assertIsNone(bash_argv(command))
+		with self.assertRaisesRegex(Exception,'without a shell'):
+			bash('echo $HOME',scroll=False,shell=False)
+		# lists are quoted for the shell
+		result = bash(['echo','hi','a  b'],scroll=False,shell=True)
+		self.assertEqual(result.stdout,'hi a  b\n')
+	def test_bash_log_fail(self):
+		with contextlib.redirect_stdout(io.StringIO()):
+			with self.assertRaisesRegex(Exception,'bash error, see'):
+				bash('exit 3',log=self.log)
+			result = bash('exit 3',log=self.log,permit_fail=True)
+		self.assertEqual(result.code,3)
+
+class TestBashAsync(unittest.TestCase):
+	"""
+	Test the asyncio interface to the shell.
+	"""
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.log = os.path.join(self.tmpdir.name,'run.log')
+	def tearDown(self):
+		self.tmpdir.cleanup()
+	def test_bash_async_match(self):
+		# the async version returns the same results as bash
+		for kwargs in [dict(scroll=False),dict(scroll=True),
+			dict(scroll=True,log=self.log),dict(scroll=False,log=self.log)]:
+			command = 'echo hello; printf "a\\rb\\n"'
+			with contextlib.redirect_stdout(io.StringIO()) as stdout:
+				expected = bash(command,**kwargs)
+			with contextlib.redirect_stdout(io.StringIO()) as stdout_async:
+				result = asyncio.run(bash_async(command,**kwargs))
+			self.assertEqual(result,expected)
+			self.assertEqual(stdout_async.getvalue(),stdout.getvalue())
+	def test_bash_async_fail(self):
+		with contextlib.redirect_stdout(io.StringIO()):
+			with self.assertRaisesRegex(Exception,'returncode 2'):
+				asyncio.run(bash_async('exit 2'))
+			result = asyncio.run(bash_async('exit 2',permit_fail=True))
+		self.assertEqual(result.code,2)
+	def test_bash_gather(self):
+		commands = dict(one='sleep 0.2; echo 1',two='echo 2',three='exit 1')
+		with contextlib.redirect_stdout(io.StringIO()) as stdout:
+			results = asyncio.run(bash_gather(commands,limit=2))
+		self.assertEqual(list(results),['one','two','three'])
+		self.assertEqual(results['one'].stdout,'1\n')
+		self.assertIsInstance(results['three'],Exception)
+		self.assertIn('[two] 2\n',stdout.getvalue())
+
+class TestBashMany(unittest.TestCase):
+	"""
+	Test running commands in parallel with bash_many.
+	"""
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+	def tearDown(self):
+		self.tmpdir.cleanup()
+	def test_bash_many(self):
+		commands = dict(one='echo 1',two='echo 2; exit 3')
+		with contextlib.redirect_stdout(io.StringIO()) as stdout:
+			results = bash_many(commands,workers=2,log_dir=self.tmpdir.name)
+		self.assertEqual(list(results),['one','two'])
+		self.assertEqual((results['one'].code,results['one'].error),(0,None))
+		self.assertEqual(results['two'].code,3)
+		self.assertIn('returncode 3',results['two'].error)
+		self.assertIn('[LOG] two.log | 2\n',stdout.getvalue())
+		with open(os.path.join(self.tmpdir.name,'one.log')) as fp:
+			self.assertEqual(fp.read(),'1\n')
+	def test_bash_many_fail_fast(self):
+		commands = ['exit 1']+['sleep 0.1']*8
+		with contextlib.redirect_stdout(io.StringIO()):
+			with self.assertRaisesRegex(Exception,'stopped on command-0'):
+				bash_many(commands,workers=1,log_dir=self.tmpdir.name,
+					fail_fast=True)
+		# pending commands were cancelled
+		self.assertLess(len(os.listdir(self.tmpdir.name)),9)
+
+class TestShellSession(unittest.TestCase):
+	"""
+	Test running commands in a persistent shell.
+	"""
+	def test_shell_session(self):
+		with ShellSession(setup='export ORTHO_TEST=ready') as session:
+			session.run('cd /')
+			result = session.run('echo $ORTHO_TEST; pwd; echo err >&2')
+			self.assertEqual((result.stdout,result.stderr,result.code),
+				('ready\n/\n','err\n',0))
+			# output without a trailing newline is returned exactly
+			self.assertEqual(session.run('printf abc').stdout,'abc')
+			# commands cannot read the stream that carries the commands
+			self.assertEqual(session.run('cat').stdout,'')
+			result = session.run('(exit 3)',permit_fail=True)
+			self.assertEqual(result.code,3)
+			with self.assertRaisesRegex(Exception,'returncode 2'):
+				session.run('if then')
+			self.assertEqual(session.run('echo "still here"').stdout,
+				'still here\n')
+	def test_shell_session_exit(self):
+		with ShellSession() as session:
+			with self.assertRaisesRegex(Exception,'has exited'):
+				session.run('exit 1')
+	def test_shell_session_timeout(self):
+		with ShellSession() as session:
+			start = time.time()
+			with self.assertRaises(BashTimeout):
+				session.run('sleep 30',timeout=0.2)
+			self.assertLess(time.time()-start,3)
+
+class TestTeeMultiplexer(unittest.TestCase):
+	"""
+	Test sending output to the screen and a log.
+	"""
+	def test_tee(self):
+		for buffered in [False,True]:
+			screen,log = io.StringIO(),io.StringIO()
+			tee = TeeMultiplexer(screen,log,buffered=buffered)
+			self.assertTrue(tee.writable())
+			with contextlib.redirect_stdout(tee):
+				for num in range(100): print(num)
+			self.assertEqual(screen.getvalue(),''.join(
+				'%d\n'%i for i in range(100)))
+			tee.flush()
+			self.assertEqual(log.getvalue(),screen.getvalue())
+			tee.close()
+			self.assertTrue(log.closed)
+			with self.assertRaises(ValueError): tee.write('text')
+	def test_tee_file(self):
+		# the documented usage with the screen and a real log file
+		with tempfile.TemporaryDirectory() as dn:
+			for buffered in [False,True]:
+				path = os.path.join(dn,'log')
+				with contextlib.redirect_stdout(io.StringIO()) as screen:
+					tee = TeeMultiplexer(sys.stdout,open(path,'w'),
+						buffered=buffered)
+					tee.write('text\n')
+					tee.close()
+				self.assertEqual(screen.getvalue(),'text\n')
+				self.assertFalse(screen.closed)
+				with open(path) as fp: self.assertEqual(fp.read(),'text\n')
+				# closing again or collecting the object is harmless
+				tee.close()
+				del tee
+	def test_tee_flush_interval(self):
+		log = io.StringIO()
+		tee = TeeMultiplexer(io.StringIO(),log,buffered=True,
+			flush_interval=0.05)
+		tee.write('text')
+		deadline = time.time()+2
+		while not log.getvalue() and time.time()<deadline: time.sleep(0.01)
+		self.assertEqual(log.getvalue(),'text')
+		tee.close()
+
+class TestCommandCheck(unittest.TestCase):
+	"""
+	Test the cache for finding commands.
+	"""
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = os.environ.get('PATH')
+		os.environ['PATH'] = self.tmpdir.name+os.pathsep+self.path
+		command_cache.clear()
+	def tearDown(self):
+		os.environ['PATH'] = self.path
+		command_cache.clear()
+		self.tmpdir.cleanup()
+	def test_command_check(self):
+		self.assertEqual(command_check_warm(['sh','ortho_missing']),
+			dict(sh=True,ortho_missing=False))
+		self.assertFalse(command_check('ortho_missing'))
+		# a new program changes the directory and clears the cache
+		script = os.path.join(self.tmpdir.name,'ortho_missing')
+		with open(script,'w') as fp: fp.write('#!/bin/sh\n')
+		os.chmod(script,0o755)
+		os.utime(self.tmpdir.name,ns=(0,0))
+		self.assertTrue(command_check('ortho_missing'))
+		# changing the PATH uses a separate entry
+		os.environ['PATH'] = self.path
+		self.assertFalse(command_check('ortho_missing'))
+
+def bash_benchmark_spawn(command,count=500,**kwargs):
+	"""Measure the number of commands per second that bash can start."""
+	start = time.time()
+	for _ in range(count):
+		bash(command,scroll=False,**kwargs)
+	return count/(time.time()-start)
+
+if __name__ == '__main__' and sys.argv[1:] == ['bench']:
+
+	# benchmark via: python -m ortho.test_bash bench
+	for name,command,kwargs in [
+		('shell','true',dict(shell=True)),
+		('exec string','true',dict()),
+		('exec argv',['true'],dict())]:
+		print('status: %s spawns %.0f commands per second'%(
+			name,bash_benchmark_spawn(command,**kwargs)))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# vim: noet:ts=4:sts=4:sw=4
+
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+
+from .git import git_read_head
+from .git import get_git_hash_cached
+from .git import git_head_cache
+from .git import git_status
+from .git import git_status_many
+
+def git(path,*args):
+	"""Run git with a fixed identity for the tests."""
+	return subprocess.run(['git','-C',path,'-c','user.name=test',
+		'-c','user.email=test@example.com']+list(args),check=True,
+		stdout=subprocess.PIPE,stderr=subprocess.DEVNULL
+		).stdout.decode('utf-8').strip()
+
+class TestGitStatus(unittest.TestCase):
+	"""
+	Test collecting git metadata without the network.
+	"""
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.origin = os.path.join(self.tmpdir.name,'origin')
+		os.mkdir(self.origin)
+		git(self.origin,'init','-q','-b','main')
+		self.commit(self.origin,'a')
+		self.clone = os.path.join(self.tmpdir.name,'clone')
+		git(self.tmpdir.name,'clone','-q',self.origin,self.clone)
+	def tearDown(self):
+		self.tmpdir.cleanup()
+	def commit(self,path,name):
+		with open(os.path.join(path,name),'w') as fp: fp.write(name)
+		git(path,'add',name)
+		git(path,'commit','-q','-m',name)
+	def test_git_read_head(self):
+		head = git_read_head(self.clone)
+		self.assertEqual((head.hash,head.branch),
+			(git(self.clone,'rev-parse','HEAD'),'main'))
+		# packed refs are read directly too
+		git(self.clone,'pack-refs','--all')
+		self.assertEqual(git_read_head(self.clone).hash,head.hash)
+		git(self.clone,'checkout','-q','--detach')
+		self.assertEqual(git_read_head(self.clone).branch,None)
+	def test_git_status(self):
+		self.commit(self.origin,'b')
+		git(self.clone,'fetch','-q')
+		self.commit(self.clone,'c')
+		with open(os.path.join(self.clone,'a'),'w') as fp: fp.write('edit')
+		status = git_status(self.clone)
+		self.assertEqual((status.branch,status.dirty,status.ahead,
+			status.behind),('main',True,1,1))
+		# the origin has no upstream and cannot be compared
+		results = git_status_many([self.origin,self.clone,self.tmpdir.name])
+		self.assertEqual(list(results),[self.origin,self.clone,
+			self.tmpdir.name])
+		self.assertEqual((results[self.origin].dirty,
+			results[self.origin].behind),(False,None))
+		self.assertEqual(results[self.tmpdir.name].hash,None)
+	def test_get_git_hash_cached(self):
+		for path in [self.clone,self.clone+'/']:
+			self.assertEqual(get_git_hash_cached(path),
+				git(self.clone,'rev-parse','HEAD'))
+		start = time.time()
+		for _ in range(1000): get_git_hash_cached(self.clone)
+		# a lookup only checks a few files instead of running git
+		self.assertLess(time.time()-start,1)
+		# the cache follows new commits, packed refs, and checkouts
+		self.commit(self.clone,'b')
+		self.assertEqual(get_git_hash_cached(self.clone),
+			git(self.clone,'rev-parse','HEAD'))
+		git(self.clone,'pack-refs','--all')
+		self.assertEqual(get_git_hash_cached(self.clone),
+			git(self.clone,'rev-parse','HEAD'))
+		git(self.clone,'checkout','-q','HEAD~1')
+		self.assertEqual(get_git_hash_cached(self.clone),
+			git(self.clone,'rev-parse','HEAD'))
+	def test_get_git_hash_cached_worktree(self):
+		# worktrees have a .git file so we ask git
+		worktree = os.path.join(self.tmpdir.name,'worktree')
+		git(self.clone,'worktree','add','-q','--detach',worktree)
+		self.assertEqual(get_git_hash_cached(worktree),
+			git(self.clone,'rev-parse','HEAD'))
+		self.assertNotIn(worktree,git_head_cache)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# vim: noet:ts=4:sts=4:sw=4
+
+import os
+import time
+import errno
+import tempfile
+import threading
+import unittest
+
+from .locker import SimpleFlock
+
+class TestSimpleFlock(unittest.TestCase):
+	"""
+	Test the file lock under contention.
+	"""
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.tmpdir.name,'.state.lock')
+	def tearDown(self):
+		self.tmpdir.cleanup()
+	def hold(self,seconds):
+		"""Hold the lock in a thread and return once it is locked."""
+		locked = threading.Event()
+		def target():
+			with SimpleFlock(self.path):
+				locked.set()
+				time.sleep(seconds)
+		thread = threading.Thread(target=target)
+		thread.start()
+		locked.wait()
+		return thread
+	def test_flock_backoff(self):
+		for timeout in [None,5]:
+			thread = self.hold(0.1)
+			# the wait is no longer rounded up to a half second
+			with SimpleFlock(self.path,timeout=timeout) as lock:
+				self.assertLess(lock.wait,0.45)
+				self.assertGreaterEqual(lock.wait,0.05)
+			thread.join()
+	def test_flock_timeout(self):
+		timeouts = SimpleFlock.metrics['timeouts']
+		thread = self.hold(0.5)
+		with self.assertRaises(OSError) as error:
+			with SimpleFlock(self.path,timeout=0.1): pass
+		self.assertEqual(error.exception.errno,errno.EAGAIN)
+		self.assertEqual(SimpleFlock.metrics['timeouts'],timeouts+1)
+		thread.join()
+	def test_flock_exclusive(self):
+		# the holder unlinks the lock file so waiters must check the path
+		counter = os.path.join(self.tmpdir.name,'counter')
+		with open(counter,'w') as fp: fp.write('0')
+		def increment():
+			for _ in range(20):
+				with SimpleFlock(self.path,timeout=10):
+					with open(counter) as fp: value = int(fp.read())
+					time.sleep(0.001)
+					with open(counter,'w') as fp: fp.write(str(value+1))
+		threads = [threading.Thread(target=increment) for _ in range(8)]
+		for thread in threads: thread.start()
+		for thread in threads: thread.join()
+		with open(counter) as fp: self.assertEqual(int(fp.read()),160)
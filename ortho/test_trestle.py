@@ -32,10 +32,17 @@ We need more tests, but this demonstrates the pattern.
 """
 
 import io
+import os
 import sys
+import tempfile
 import unittest
 
-from . import build_trestle, Trestle, TrestleDocument
+from . import build_trestle, Trestle, TrestleDocument, TrestleRequired
+from . import trestle_batch
+from . import trestle_slots
+from . import trestle_nesting_typer
+from .yaml_trestle import ExceptionTrestleChildren
+from .yaml_trestle import TrestleYAMLPool
 from . import Dispatcher
 from . import build_trestle
 
@@ -118,6 +125,19 @@ class HandlerB(ScannerYAML):
 			out['g'] = self.g
 		return out
 
+# declared fields compile a faster constructor which applies the defaults
+class HandlerFields(ScannerYAML):
+	yaml_tag = '!kind_fields'
+	trestle_fields = dict(a=TrestleRequired,b=TrestleRequired,c='default')
+	def __init__(self,*,a,b,c):
+		self.a = a
+		self.b = b
+		self.c = c
+		print('status: we are in the HandlerFields constructor')
+	@property
+	def clean(self):
+		return dict(a=self.a,b=self.b,c=self.c)
+
 # STEP 4: Attach to YAML
 # We must prepare a YAML instance and attach our custom objects to it.
 
@@ -126,8 +146,78 @@ tags_yaml_objects = [i for i in globals().keys() - keys_globals]
 tags_yaml_objects = [globals()[tag] for tag in globals().keys() - keys_globals 
 	if hasattr(globals().get(tag,None),'yaml_tag')]
 
+# an incremental document only builds new or edited children
+class MyIndexIncremental(MyIndex):
+	yaml_tag = '!my_doc_incremental'
+	trestle_incremental = True
+
+# documents that build their children in a pool
+class MyIndexThreads(MyIndex):
+	yaml_tag = '!my_doc_threads'
+	trestle_executor = 'thread'
+	trestle_workers = 4
+
+class MyIndexProcesses(MyIndex):
+	yaml_tag = '!my_doc_processes'
+	trestle_executor = 'process'
+	trestle_workers = 2
+
+# compact objects use __slots__ generated from the declared fields
+@trestle_slots
+class HandlerSlots(Trestle):
+	yaml_tag = '!kind_slots'
+	trestle_fields = dict(a=TrestleRequired,b=TrestleRequired,c=None)
+
+class HandlerDict(Trestle):
+	yaml_tag = '!kind_dict'
+	def __init__(self,*,a,b,c=None):
+		self.a = a
+		self.b = b
+		self.c = c
+	@property
+	def clean(self):
+		return dict([(key,val) for key,val in 
+			dict(a=self.a,b=self.b,c=self.c).items() if val is not None])
+
+class HandlerValue(Trestle):
+	yaml_tag = '!kind_value'
+	def __init__(self,value=None,*args,**kwargs):
+		self.value = value
+		self.args = args
+		self.kwargs = kwargs
+
+def trestle_benchmark_memory(cls,size=500,document=False):
+	"""
+	Measure the memory per object held by a loaded trestle document.
+	By default we only count the objects built from the entries of the 
+	document, since the parser adds noise to the document total.
+	"""
+	import gc
+	import tracemalloc
+	from ruamel.yaml import YAML
+	yaml_this = YAML(typ='rt')
+	yaml_this.register_class(cls)
+	# entries mix required and optional fields with distinct strings
+	text = ''.join(['- %s\n  a: %d\n  b: name-%d\n'%(cls.yaml_tag,num,num)+
+		('  c: extra-%d\n'%num if num%3==0 else '') for num in range(size)])
+	if document:
+		build = lambda: yaml_this.load(text)
+	else:
+		items = YAML(typ='safe').load(text.replace(cls.yaml_tag,''))
+		build = lambda: [cls(**item) for item in items]
+	# build once first so caches in the parser are not counted
+	build()
+	gc.collect()
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	data = build()
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return (after-before)/len(data)
+
 # prepare the YAML instance
 from ruamel.yaml import YAML,yaml_object
+from ruamel.yaml.constructor import DuplicateKeyError
 yaml = YAML(typ='rt')
 yaml.width = 80
 
@@ -183,6 +273,32 @@ test_A_out_header = """\
   g: 5
 """
 
+test_A_input_bad = """\
+!my_doc
+- a: 1
+  b: 2
+- z: 3
+"""
+
+test_B_input = """\
+!my_doc_incremental
+- a: 1
+  b: 2
+- e: 3
+  f: 4
+"""
+
+test_B_append = """\
+- a: 5
+  b: 6
+"""
+
+def trestle_benchmark_document(tag='!my_doc',size=5000):
+	"""Make a large document for benchmarking the trestle."""
+	items = [('- a: %d\n  b: %d\n' if num%2 else '- e: %d\n  f: %d\n')%(
+		num,num+1) for num in range(size)]
+	return tag+'\n'+''.join(items)
+
 # dev: needs more tests
 
 ### TEST SET
@@ -210,9 +326,302 @@ class TestTrestle(unittest.TestCase):
 		r = test_A_out_header
 		self.assertEqual(l,r)
 
+class TestTrestleFields(unittest.TestCase):
+	"""
+	Test the compiled constructor for classes with declared fields.
+	"""
+	def setUp(self):
+		sys.stdout = io.StringIO()
+	def test_trestle_fields(self):
+		data = yaml.load('!kind_fields\na: 1\nb: 2\nc: 3\n')
+		self.assertEqual((data.a,data.b,data.c),(1,2,3))
+	def test_trestle_fields_default(self):
+		data = yaml.load('!kind_fields\na: 1\nb: 2\n')
+		self.assertEqual((data.a,data.b,data.c),(1,2,'default'))
+		# classes without declared fields keep the generic constructor
+		self.assertIsNone(HandlerA._trestle_compiled)
+	def test_trestle_fields_unexpected(self):
+		with self.assertRaisesRegex(Exception,'unexpected keys'):
+			yaml.load('!kind_fields\na: 1\nb: 2\nd: 3\n')
+	def test_trestle_fields_missing(self):
+		with self.assertRaisesRegex(Exception,'missing keys'):
+			yaml.load('!kind_fields\na: 1\n')
+	def test_trestle_fields_duplicate(self):
+		# the compiled constructor validates duplicates like the generic one
+		with self.assertRaises(DuplicateKeyError):
+			yaml.load('!kind_fields\na: 1\na: 2\nb: 2\nc: 3\n')
+		yaml_dups = YAML(typ='rt')
+		yaml_dups.allow_duplicate_keys = True
+		yaml_dups.register_class(HandlerFields)
+		data = yaml_dups.load('!kind_fields\na: 1\na: 2\nb: 2\nc: 3\n')
+		self.assertEqual((data.a,data.b,data.c),(1,2,3))
+
+class TestTrestleSlots(unittest.TestCase):
+	"""
+	Test compact trestle objects with __slots__.
+	"""
+	def test_trestle_slots(self):
+		yaml_slots = YAML(typ='rt')
+		yaml_slots.register_class(HandlerSlots)
+		text = '- !kind_slots\n  a: 1\n  b: 2\n- !kind_slots\n  a: 3\n  b: 4\n  c: 5\n'
+		data = yaml_slots.load(text)
+		self.assertFalse(hasattr(data[0],'__dict__'))
+		self.assertEqual(data[0].clean,{'a':1,'b':2})
+		out = io.StringIO()
+		yaml_slots.dump(data,out)
+		self.assertEqual(out.getvalue(),text)
+	def test_trestle_slots_super(self):
+		# methods that call super() without arguments use the new class
+		@trestle_slots
+		class HandlerSlotsSuper(Trestle):
+			yaml_tag = '!kind_slots_super'
+			trestle_fields = dict(a=TrestleRequired)
+			def __init__(self,a):
+				super().__init__()
+				self.a = a
+			@property
+			def clean(self):
+				return dict(a=self.a)
+		item = HandlerSlotsSuper(a=1)
+		self.assertEqual((item.a,item.clean),(1,{'a':1}))
+		self.assertEqual(HandlerSlotsSuper.__qualname__,
+			'TestTrestleSlots.test_trestle_slots_super.'
+			'<locals>.HandlerSlotsSuper')
+	def test_trestle_slots_missing(self):
+		with self.assertRaisesRegex(TypeError,'missing required'):
+			HandlerSlots(a=1)
+	def test_trestle_slots_memory(self):
+		self.assertLess(
+			trestle_benchmark_memory(HandlerSlots),
+			trestle_benchmark_memory(HandlerDict))
+
+class TestTrestleNestingTyper(unittest.TestCase):
+	"""
+	Test conversions in trestle_nesting_typer.
+	"""
+	def test_typer_conversions(self):
+		item = HandlerValue('x')
+		self.assertIs(trestle_nesting_typer(HandlerValue,item),item)
+		self.assertIsNone(trestle_nesting_typer(HandlerValue,None))
+		self.assertEqual(trestle_nesting_typer(HandlerValue,'x').value,'x')
+		self.assertEqual(
+			trestle_nesting_typer(HandlerValue,{'a':1}).kwargs,{'a':1})
+		self.assertEqual(
+			trestle_nesting_typer(HandlerValue,[1,2]).args,(2,))
+		with self.assertRaises(TypeError):
+			trestle_nesting_typer(HandlerValue,1)
+	def test_typer_memo(self):
+		# build the strings at runtime so they are distinct objects
+		left,right = ''.join(['a','b']),''.join(['a','b'])
+		self.assertIsNot(left,right)
+		one = trestle_nesting_typer(HandlerValue,left,memo=True)
+		two = trestle_nesting_typer(HandlerValue,right,memo=True)
+		# the strings are interned but the objects are never shared
+		self.assertIs(one.value,two.value)
+		self.assertIsNot(one,two)
+		self.assertEqual(trestle_nesting_typer(
+			HandlerValue,('a',[1]),memo=True).args,([1],))
+
+class TestTrestleIncremental(unittest.TestCase):
+	"""
+	Test the incremental mode which skips unchanged children.
+	"""
+	def test_trestle_incremental(self):
+		yaml_inc = YAML(typ='rt')
+		_,trestle_text_inc = build_trestle(
+			tags=tags_yaml_objects+[MyIndexIncremental],
+			yaml=yaml_inc,get_text_completer=True)
+		# count constructor calls from the status messages
+		def complete(text):
+			sys.stdout = io.StringIO()
+			out = trestle_text_inc(text)
+			return out,sys.stdout.getvalue().count('constructor')
+		out,count = complete(test_B_input)
+		self.assertEqual(count,2)
+		# tagged children are built once more and then cached
+		out,count = complete(out)
+		self.assertEqual(count,2)
+		out_again,count = complete(out)
+		self.assertEqual((out_again,count),(out,0))
+		# appending an item only builds the new item
+		out_append,count = complete(out+test_B_append)
+		self.assertEqual(count,1)
+		self.assertEqual(out_append,complete(out_append)[0])
+	def test_trestle_incremental_duplicates(self):
+		# identical children are separate objects so we never write aliases
+		sys.stdout = io.StringIO()
+		_,complete = build_trestle(tags=tags_yaml_objects+[MyIndexIncremental],
+			yaml=YAML(typ='rt'),get_text_completer=True)
+		text = '!my_doc_incremental\n- a: 1\n  b: 2\n- a: 1\n  b: 2\n'
+		outs = [text]
+		for _ in range(3): outs.append(complete(outs[-1]))
+		self.assertNotIn('&id',outs[-1])
+		self.assertEqual(outs[-1],outs[-2])
+	def test_trestle_incremental_files(self):
+		# each file has its own cache so documents never share children
+		sys.stdout = io.StringIO()
+		complete = build_trestle(tags=tags_yaml_objects+[MyIndexIncremental],
+			yaml=YAML(typ='rt'))
+		with tempfile.TemporaryDirectory() as dn:
+			paths = [os.path.join(dn,'%s.yaml'%i) for i in 'xy']
+			for path in paths:
+				with open(path,'w') as fp: fp.write(test_B_input)
+			for _ in range(3):
+				x,y = [complete(path) for path in paths]
+			self.assertIsNot(x.data[0],y.data[0])
+			# a repeated completion of one file reuses its children
+			self.assertIs(complete(paths[0]).data[0],x.data[0])
+
+class TestTrestleExecutor(unittest.TestCase):
+	"""
+	Test construction of document children in a pool.
+	"""
+	def setUp(self):
+		sys.stdout = io.StringIO()
+		self.yaml = YAML(typ='rt')
+		_,self.complete = build_trestle(
+			tags=tags_yaml_objects+[MyIndexThreads,MyIndexProcesses],
+			yaml=self.yaml,get_text_completer=True)
+	def check_executor(self,tag,size):
+		serial = self.complete(trestle_benchmark_document(size=size))
+		pooled = self.complete(trestle_benchmark_document(tag=tag,size=size))
+		self.assertEqual(pooled,serial.replace('!my_doc',tag,1))
+	def test_trestle_threads(self):
+		self.check_executor('!my_doc_threads',2000)
+	def test_trestle_processes(self):
+		self.check_executor('!my_doc_processes',200)
+	def test_trestle_threads_errors(self):
+		text = '!my_doc_threads\n- a: 1\n  b: 2\n- z: 1\n- a: 3\n- y: 2\n'
+		with self.assertRaises(ExceptionTrestleChildren) as context:
+			self.complete(text)
+		self.assertEqual(set(context.exception.errors),{1,2,3})
+
+class TestTrestlePool(unittest.TestCase):
+	"""
+	Test concurrent text completion with a pool of YAML instances.
+	"""
+	def test_trestle_pool(self):
+		import concurrent.futures
+		sys.stdout = io.StringIO()
+		_,complete = build_trestle(
+			tags=tags_yaml_objects,yaml=yaml,
+			get_text_completer=True,pool_size=4)
+		expected = test_A_out.split('\n',1)[1]
+		with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+			results = list(pool.map(complete,[test_A_input]*64))
+		self.assertEqual(results,[expected]*64)
+	def test_trestle_pool_settings(self):
+		# every instance in the pool formats documents like the original
+		yaml_styled = YAML(typ='rt')
+		yaml_styled.top_level_colon_align = True
+		yaml_styled.indent(mapping=4,sequence=6,offset=3)
+		yaml_styled.compact(seq_seq=False,seq_map=False)
+		yaml_styled.width = 20
+		pool = TrestleYAMLPool(yaml=yaml_styled,tags=tags_yaml_objects,size=3)
+		data = {'a':1,'zzzz':[{'b':2}],'long':' '.join(['word']*10)}
+		outputs = []
+		for yaml_this in list(pool.queue.queue):
+			out = io.StringIO()
+			yaml_this.dump(data,out)
+			outputs.append(out.getvalue())
+		self.assertIn('a   :',outputs[0])
+		self.assertEqual(outputs,outputs[:1]*3)
+
+class TestTrestleFile(unittest.TestCase):
+	"""
+	Test the trestle completer on files.
+	"""
+	def setUp(self):
+		sys.stdout = io.StringIO()
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.tmpdir.name,'doc.yaml')
+		with open(self.path,'w') as fp:
+			fp.write(test_A_input)
+	def tearDown(self):
+		self.tmpdir.cleanup()
+	def test_trestle_file(self):
+		trestle(self.path)
+		with open(self.path) as fp:
+			self.assertEqual('# hello\n'+fp.read(),test_A_out)
+	def test_trestle_file_unchanged(self):
+		trestle(self.path)
+		# backdate the file so we can detect a rewrite
+		os.utime(self.path,(0,0))
+		trestle(self.path)
+		self.assertEqual(os.stat(self.path).st_mtime,0)
+	def test_trestle_file_atomic_lock(self):
+		trestle_lock = build_trestle(
+			tags=tags_yaml_objects,yaml=yaml,lock=True)
+		trestle_lock(self.path)
+		# the temporary file and the lock are removed
+		self.assertEqual(os.listdir(self.tmpdir.name),['doc.yaml'])
+		with open(self.path) as fp:
+			self.assertEqual('# hello\n'+fp.read(),test_A_out)
+	def test_trestle_file_symlink(self):
+		# the completer writes through a link instead of replacing it
+		link = os.path.join(self.tmpdir.name,'link.yaml')
+		os.symlink(self.path,link)
+		trestle(link)
+		self.assertTrue(os.path.islink(link))
+		with open(self.path) as fp:
+			self.assertEqual('# hello\n'+fp.read(),test_A_out)
+	def test_trestle_file_hardlink(self):
+		link = os.path.join(self.tmpdir.name,'link.yaml')
+		os.link(self.path,link)
+		trestle(link)
+		self.assertTrue(os.path.samefile(link,self.path))
+		with open(self.path) as fp:
+			self.assertEqual('# hello\n'+fp.read(),test_A_out)
+	def test_trestle_file_failure(self):
+		with open(self.path,'w') as fp:
+			fp.write(test_A_input_bad)
+		with self.assertRaises(Exception):
+			trestle(self.path)
+		with open(self.path) as fp:
+			self.assertEqual(fp.read(),test_A_input_bad)
+	def test_trestle_batch(self):
+		paths = []
+		for num in range(4):
+			path = os.path.join(self.tmpdir.name,'item%d.yaml'%num)
+			with open(path,'w') as fp:
+				fp.write(test_A_input if num else test_A_input_bad)
+			paths.append(path)
+		results = list(trestle_batch(
+			os.path.join(self.tmpdir.name,'item*.yaml'),
+			tags=tags_yaml_objects,workers=2))
+		errors = dict([(i.path,i.error) for i in results])
+		self.assertEqual(set(errors),set(paths))
+		self.assertTrue(errors[paths[0]])
+		for path in paths[1:]:
+			self.assertIsNone(errors[path])
+			with open(path) as fp:
+				self.assertEqual('# hello\n'+fp.read(),test_A_out)
+
 ### MAIN
 
-if __name__ == '__main__':
+if __name__ == '__main__' and sys.argv[1:] == ['bench']:
+
+	# benchmark via: python -m ortho.test_trestle bench
+	import time
+	_,complete = build_trestle(
+		tags=tags_yaml_objects+[MyIndexThreads,MyIndexProcesses],
+		yaml=YAML(typ='rt'),get_text_completer=True)
+	stdout = sys.stdout
+	for tag in ['!my_doc','!my_doc_threads','!my_doc_processes']:
+		text = trestle_benchmark_document(tag=tag,size=5000)
+		sys.stdout = io.StringIO()
+		start = time.time()
+		complete(text)
+		sys.stdout = stdout
+		print('status: completed 5000 entries with %s in %.2fs'%(
+			tag,time.time()-start))
+	for cls in [HandlerDict,HandlerSlots]:
+		print('status: %s uses %d bytes per object and %d bytes per entry '
+			'in a document'%(cls.__name__,
+			trestle_benchmark_memory(cls,size=5000),
+			trestle_benchmark_memory(cls,size=5000,document=True)))
+
+elif __name__ == '__main__':
 
 	# a simple demonstration, via: python -i -m ortho.test_trestle
 	print('status: starting with a single tag at the top of the document:\n')
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # vim: noet:ts=4:sts=4:sw=4
 
+import io
 import os
+import contextlib
 import unittest
 import yaml
 import ruamel.yaml as yamlr
@@ -12,8 +14,14 @@ from .yaml import YAMLAnchorInclude
 from .yaml import YAMLIncludeBase
 from .yaml import yaml_clean
 from .yaml import yaml_clean_class
+from .yaml import yaml_str
+from .yaml import yaml_stream
+from .yaml import yaml_add_representers
 from .yaml_include import YAML as YAMLI
 
+try: import numpy as np
+except ImportError: np = None
+
 # dev: note no testing of YAMLIncludeBase yet, which requires files
 
 class ExampleYaml:
@@ -278,3 +286,73 @@ class YAMLTalk(unittest.TestCase):
 		loaded = yaml.load(text_has_anchors_tags,Loader=yaml.Loader)
 		cleaned = yaml_clean(loaded)
 		self.assertEqual(cleaned,{'greeting':'hello mary'})
+
+class YAMLStream(unittest.TestCase):
+	"""
+	Write YAML to streams and paths without building the full string.
+	"""
+	def setUp(self):
+		self.yaml = yamlr.YAML(typ='rt')
+		self.data = {'items':[{'name':'item%d'%i,'value':i} 
+			for i in range(100)]}
+		self.text = yaml_str(yaml=self.yaml,obj=self.data)
+	def test_yaml_stream_text(self):
+		import io
+		fp = io.StringIO()
+		written = yaml_stream(yaml=self.yaml,obj=self.data,
+			stream=fp,buffer_size=64)
+		self.assertEqual(fp.getvalue(),self.text)
+		self.assertEqual(written,len(self.text))
+	def test_yaml_stream_binary(self):
+		import io
+		fp = io.BytesIO()
+		yaml_stream(yaml=self.yaml,obj=self.data,stream=fp)
+		self.assertEqual(fp.getvalue().decode('utf-8'),self.text)
+	def test_yaml_stream_path(self):
+		import tempfile
+		with tempfile.TemporaryDirectory() as tmpdir:
+			path = os.path.join(tmpdir,'out.yaml')
+			yaml_stream(yaml=self.yaml,obj=self.data,stream=path)
+			with open(path) as fp:
+				self.assertEqual(fp.read(),self.text)
+	def test_yaml_stream_unrepresentable(self):
+		import io
+		with self.assertRaisesRegex(Exception,'cannot represent'):
+			yaml_stream(yaml=self.yaml,obj={'a':object()},stream=io.StringIO())
+
+@unittest.skipIf(np is None,'numpy is not installed')
+class YAMLRepresentersNumpy(unittest.TestCase):
+	"""
+	Dump NumPy objects with the representer registry.
+	"""
+	def setUp(self):
+		self.yaml = yamlr.YAML(typ='rt')
+	def test_numpy_scalars(self):
+		data = {'a':np.float64(1.5),'b':np.int32(2),'c':np.bool_(True)}
+		text = yaml_str(yaml=self.yaml,obj=data,representers=True)
+		self.assertEqual(text,'a: 1.5\nb: 2\nc: true\n')
+	def test_numpy_array_flow(self):
+		data = {'x':np.arange(3),'y':np.eye(2)}
+		text = yaml_str(yaml=self.yaml,obj=data,representers=True)
+		self.assertEqual(text,'x: [0, 1, 2]\ny: [[1.0, 0.0], [0.0, 1.0]]\n')
+	def test_numpy_array_binary(self):
+		yaml_add_representers(self.yaml,'numpy',
+			numpy=dict(binary_threshold=10))
+		data = {'x':np.linspace(0,1,100).reshape(10,10)}
+		text = yaml_str(yaml=self.yaml,obj=data)
+		self.assertIn('!ndarray',text)
+		loaded = self.yaml.load(text)
+		self.assertTrue(np.array_equal(loaded['x'],data['x']))
+	def test_numpy_instance(self):
+		# representers and their options stay with one instance
+		yaml_add_representers(self.yaml,'numpy',numpy=dict(binary_threshold=2))
+		self.assertIn('!ndarray',yaml_str(yaml=self.yaml,obj=np.arange(3)))
+		with self.assertRaises(yamlr.representer.RepresenterError):
+			with contextlib.redirect_stdout(io.StringIO()):
+				yaml_str(yaml=yamlr.YAML(typ='rt'),obj=np.arange(3))
+		# repeated calls with the same options do not register again
+		representer = self.yaml.Representer
+		yaml_add_representers(self.yaml,'numpy',numpy=dict(binary_threshold=2))
+		self.assertIs(self.yaml.Representer,representer)
+		self.assertEqual(self.yaml._added_representers,
+			dict(numpy=dict(binary_threshold=2)))
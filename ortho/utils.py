@@ -12,6 +12,7 @@ import sys
 import psutil
 import pprint
 import subprocess
+import tempfile
 
 def catalog(base,path=None):
 	"""
@@ -125,6 +126,39 @@ class Struct:
 	def __repr__(self): 
 		return pprint.pformat(self.__dict__)
 
+def write_atomic(path,text,fsync=True):
+	"""
+	Write text to a file so that readers see either the old or new contents.
+	We write a temporary file in the same directory, sync it, and then replace
+	the target, so a failure or a kill signal never truncates the original.
+	"""
+	# write through symlinks to the real file since replace swaps the link
+	path = os.path.realpath(path)
+	# replacing a file with hard links would detach it from the other links
+	#   so we fall back to writing in place
+	if os.path.exists(path) and os.stat(path).st_nlink > 1:
+		with open(path,'w') as fp:
+			fp.write(text)
+			fp.flush()
+			if fsync: os.fsync(fp.fileno())
+		return
+	dirname = os.path.dirname(path)
+	fd,path_tmp = tempfile.mkstemp(
+		dir=dirname,prefix='.%s.'%os.path.basename(path),suffix='.tmp')
+	try:
+		with os.fdopen(fd,'w') as fp:
+			fp.write(text)
+			fp.flush()
+			if fsync: os.fsync(fp.fileno())
+		# mkstemp is private to the user so we keep the original permissions
+		if os.path.exists(path):
+			os.chmod(path_tmp,os.stat(path).st_mode & 0o7777)
+		os.replace(path_tmp,path)
+	except:
+		try: os.unlink(path_tmp)
+		except OSError: pass
+		raise
+
 def get_cpu_cores():
 	"""
 	Report the number of physical CPU cores (i.e. without hyperthreading).
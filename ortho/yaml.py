@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # vim: noet:ts=4:sts=4:sw=4
 
+import os
 import yaml
 import re
 import io
@@ -182,31 +183,193 @@ def collect_anchors(data):
 			index[val.anchor.value] = val
 	return index
 
-def yaml_str(*,yaml,obj,**options):
+### FEATURE: representers for types from other packages
+
+# registry of functions that add representers to a ruamel.yaml instance. each
+#   entry is keyed by the package that supplies the types so we can avoid 
+#   importing anything until a document actually needs it
+yaml_representers = {}
+
+def yaml_representer(package):
 	"""
-	Wrapper for ruamel.yaml to make a string.
-	Send along a `yaml` instance and `obj`.
+	Decorator to register a function that adds representers for a package.
+	"""
+	def wrapper(func):
+		yaml_representers[package] = func
+		return func
+	return wrapper
+
+@yaml_representer('numpy')
+def yaml_represent_numpy(yaml,binary_threshold=None,flow_style=True):
+	"""
+	Add representers for NumPy scalars and arrays.
+	Arrays become flow sequences, or, if they have at least `binary_threshold`
+	elements, a tagged mapping with the raw buffer which loads with the
+	matching constructor.
+	"""
+	import numpy as np
+	tag_array = '!ndarray'
+	def represent_scalar(representer,data):
+		return representer.represent_data(data.item())
+	def represent_array(representer,data):
+		if binary_threshold is not None and data.size >= binary_threshold:
+			return representer.represent_mapping(tag_array,{
+				'dtype':data.dtype.str,'shape':list(data.shape),
+				'data':np.ascontiguousarray(data).tobytes()})
+		# tolist converts the entire array in C instead of element by element
+		return representer.represent_sequence('tag:yaml.org,2002:seq',
+			data.tolist(),flow_style=flow_style)
+	def construct_array(constructor,node):
+		import ruamel.yaml
+		data = ruamel.yaml.constructor.SafeConstructor.construct_mapping(
+			constructor,node,deep=True)
+		return np.frombuffer(data['data'],dtype=np.dtype(data['dtype'])
+			).reshape(data['shape'])
+	# multi representers match subclasses so np.generic covers all scalars
+	yaml.Representer.add_multi_representer(np.generic,represent_scalar)
+	yaml.Representer.add_representer(np.ndarray,represent_array)
+	yaml.Constructor.add_constructor(tag_array,construct_array)
+
+def yaml_private_classes(yaml):
+	"""
+	Give a ruamel.yaml instance its own representer and constructor classes.
+	The add_representer and add_constructor methods modify the class, which is
+	otherwise shared by every instance in the process.
 	"""
+	if vars(yaml).get('_private_classes'): return yaml
+	yaml.Representer = type(yaml.Representer.__name__,(yaml.Representer,),{})
+	yaml.Constructor = type(yaml.Constructor.__name__,(yaml.Constructor,),{})
+	# the components are built on demand so we drop any from the old classes
+	for attr in ['_representer','_constructor']:
+		if attr in vars(yaml): delattr(yaml,attr)
+	yaml._private_classes = True
+	return yaml
+
+def yaml_add_representers(yaml,*packages,**options):
+	"""
+	Add representers from the registry to a ruamel.yaml instance.
+	Name the packages to import them, otherwise we only use packages that are
+	already imported, since objects cannot come from a package that is absent.
+	Send options for each package as a dict keyed by the package name.
+	The representers only apply to this instance.
+	"""
+	import sys
+	if not packages:
+		packages = [i for i in yaml_representers if i in sys.modules]
+	yaml_private_classes(yaml)
+	# track the options for each package so we only register changes
+	added = vars(yaml).setdefault('_added_representers',{})
+	for package in packages:
+		if package not in yaml_representers:
+			raise Exception(f'no representers registered for {package}')
+		options_this = options.get(package,{})
+		if added.get(package) == options_this: continue
+		yaml_representers[package](yaml,**options_this)
+		added[package] = options_this
+	return yaml
+
+yaml_dump_explain = (
+	'caught an error dumping an object. please check the type and '
+	'add a representer if necessary (e.g. numpy.float64 cannot be '
+	'natively dumped unless you use representers=True)')
+
+def yaml_dump_checked(*,yaml,obj,stream,representers=None,**options):
+	"""
+	Dump to a stream with a warning for objects that need a representer.
+	Set `representers` to True to use the registry or send a dict of options
+	keyed by package name.
+	"""
+	if representers:
+		yaml_add_representers(yaml,**(
+			representers if isinstance(representers,dict) else {}))
 	# cannot dump numpy floats by default so you must cast
 	# via: https://stackoverflow.com/a/71205728
-	explain = (
-		'caught an error dumping an object. please check the type and '
-		'add a representer if necessary (e.g. numpy.float64 cannot be '
-		'natively dumped)')
 	error_keys = [
 		r'cannot represent an object']
-	# via: https://stackoverflow.com/a/63179923
-	string_stream = io.StringIO()
 	try: 
-		yaml.dump(obj, string_stream, **options)
+		yaml.dump(obj, stream, **options)
 	except Exception as e:
 		for error_key in error_keys:
 			if re.findall(
 				error_key,
 				str(e)):
-				print('warning: %s'%explain)
+				print('warning: %s'%yaml_dump_explain)
 				raise
 			else: raise
+
+class YAMLStreamWriter(io.TextIOBase):
+	"""
+	Collect text from the YAML emitter and forward it to a target in chunks.
+	The target can be a text or binary file object or a socket.
+	"""
+	def __init__(self,target,buffer_size=65536,encoding='utf-8'):
+		self.target = target
+		self.buffer_size = buffer_size
+		self.written = 0
+		self._encoding = encoding
+		self._chunks = []
+		self._size = 0
+		# sockets only accept bytes via sendall
+		if not hasattr(target,'write') and hasattr(target,'sendall'):
+			self._send = lambda text: target.sendall(text.encode(encoding))
+		elif (isinstance(target,(io.RawIOBase,io.BufferedIOBase)) or 
+			'b' in getattr(target,'mode','')):
+			self._send = lambda text: target.write(text.encode(encoding))
+		else: self._send = target.write
+
+	@property
+	def encoding(self):
+		# the emitter writes str, not bytes, when the stream has an encoding
+		return self._encoding
+
+	def writable(self):
+		return True
+
+	def write(self,text):
+		self._chunks.append(text)
+		self._size += len(text)
+		if self._size >= self.buffer_size:
+			self.flush()
+		return len(text)
+
+	def flush(self):
+		if self._chunks:
+			text = ''.join(self._chunks)
+			self._chunks,self._size = [],0
+			self._send(text)
+			self.written += len(text)
+		if hasattr(self.target,'flush'):
+			self.target.flush()
+
+def yaml_stream(*,yaml,obj,stream,buffer_size=65536,**options):
+	"""
+	Wrapper for ruamel.yaml to write to a path, file, or socket.
+	Send along a `yaml` instance, `obj`, and a writable `stream` or a path.
+	The emitter output is forwarded in chunks of `buffer_size` characters so
+	the document is never held in memory as a single string. Returns the
+	number of characters written.
+	"""
+	if isinstance(stream,(str,os.PathLike)):
+		with open(stream,'w') as fp:
+			return yaml_stream(yaml=yaml,obj=obj,stream=fp,
+				buffer_size=buffer_size,**options)
+	writer = YAMLStreamWriter(stream,buffer_size=buffer_size)
+	try:
+		yaml_dump_checked(yaml=yaml,obj=obj,stream=writer,**options)
+	finally:
+		# send the remainder even on failure so the target sees what we emitted
+		writer.flush()
+	return writer.written
+
+def yaml_str(*,yaml,obj,**options):
+	"""
+	Wrapper for ruamel.yaml to make a string.
+	Send along a `yaml` instance and `obj`. Use `representers=True` to dump
+	types from the representer registry, e.g. NumPy scalars and arrays.
+	"""
+	# via: https://stackoverflow.com/a/63179923
+	string_stream = io.StringIO()
+	yaml_dump_checked(yaml=yaml,obj=obj,stream=string_stream,**options)
 	output_str = string_stream.getvalue()
 	string_stream.close()
 	return output_str
@@ -15,9 +15,26 @@ data and tends to streamline complicated user data entry interfaces.
 #   serializer totally separate. ignore this at your own peril!
 
 import os
+import glob
+import inspect
+import copy
+import time
+import sys
+import hashlib
+import contextlib
+import queue
+import threading
+import traceback
+import concurrent.futures
 import ruamel
+import ruamel.yaml
 import typing
 from .yaml import yaml_str
+from .yaml import yaml_stream
+from .utils import write_atomic
+from .locker import SimpleFlock
+from .utils import get_cpu_cores
+from .dotdict import DotDict
 
 class TrestleDocumentXXX:
 	yaml_tag = '!doc'
@@ -77,10 +94,68 @@ class TrestleDocumentXXX:
 class ExceptionMissingTag(Exception):
     pass
 
-def build_trestle(*,tags,yaml,get_text_completer=False,header=None):
+class ExceptionTrestleChildren(Exception):
+	"""Report every child that failed to build in a TrestleDocument."""
+	def __init__(self,errors):
+		self.errors = errors
+		super().__init__('failed to build %d children: '%len(errors)+
+			'; '.join(f'{key}: {type(e).__name__}: {e}' 
+				for key,e in errors.items()))
+
+class TrestleYAMLPool:
+	"""
+	Pool of ruamel.yaml instances with registered tags for concurrent use.
+	The ruamel.yaml instances are not thread-safe, so each completion borrows 
+	one instance. Extra instances come from `yaml_factory` or copy the settings
+	of the original instance.
+	"""
+	# we copy every public setting from the original instance except for the 
+	#   constructor arguments and the state of the current document. private
+	#   settings include the version and the classes from yaml_private_classes
+	settings_skip = ['typ','pure','plug_ins','stream','doc_infos']
+	settings_private = ['_version','_tags',
+		'_private_classes','_added_representers']
+
+	@classmethod
+	def copy(cls,yaml):
+		"""Make a new instance with the settings of the original."""
+		yaml_this = ruamel.yaml.YAML(typ=yaml.typ,pure=yaml.pure)
+		for key,val in vars(yaml).items():
+			if ((key.startswith('_') and key not in cls.settings_private) 
+				or key in cls.settings_skip): continue
+			setattr(yaml_this,key,copy.copy(val))
+		return yaml_this
+
+	def __init__(self,*,yaml,tags,size,yaml_factory=None):
+		self.queue = queue.LifoQueue()
+		for num in range(size):
+			if num == 0: 
+				yaml_this = yaml
+			elif yaml_factory:
+				yaml_this = yaml_factory()
+			else: yaml_this = self.copy(yaml)
+			for tag in tags:
+				yaml_this.register_class(tag)
+			self.queue.put(yaml_this)
+
+	@contextlib.contextmanager
+	def borrow(self):
+		yaml_this = self.queue.get()
+		try: yield yaml_this
+		finally: self.queue.put(yaml_this)
+
+def build_trestle(*,tags,yaml,get_text_completer=False,header=None,
+	rewrite_unchanged=False,lock=False,lock_timeout=None,
+	pool_size=None,yaml_factory=None):
 	"""
 	Inject custom YAML tags in a parser that will then complete or audit the 
-	file as the user constructs it.
+	file as the user constructs it. The file is only rewritten when the completed
+	text differs from the original, unless `rewrite_unchanged` is set. Writes are
+	atomic and the `lock` flag serializes completers on the same file. Set 
+	`pool_size` to run completers from several threads with a TrestleYAMLPool.
+	Note that the file completer holds the completed text in memory so it can 
+	compare it with the original, while the text completer can stream output
+	with yaml_stream when you send a `stream`.
 	"""
 	# dev: the trestle feature is a candidate for a move to ortho
 	# create a round-trip YAML parser
@@ -94,39 +169,79 @@ def build_trestle(*,tags,yaml,get_text_completer=False,header=None):
 			raise ValueError(f'object {tag} has no yaml_tag attribute')
 		yaml.register_class(tag)
 
+	# completers borrow from a pool of instances or use the single instance
+	if pool_size:
+		yaml_borrow = TrestleYAMLPool(yaml=yaml,tags=tags,
+			size=pool_size,yaml_factory=yaml_factory).borrow
+	else:
+		yaml_borrow = lambda: contextlib.nullcontext(yaml)
+
+	# incremental documents cache their children for each path, and the text
+	#   completer has a single cache
+	caches,caches_lock = {},threading.Lock()
+
+	@contextlib.contextmanager
+	def yaml_caches(yaml_this,key):
+		"""Lend the caches for one path to the constructor."""
+		with caches_lock:
+			entry = caches.setdefault(key,(threading.Lock(),{}))
+		# concurrent completions of the same path do not use the cache
+		if not entry[0].acquire(blocking=False):
+			yield
+			return
+		try:
+			yaml_this.constructor.trestle_caches = entry[1]
+			yield
+		finally:
+			yaml_this.constructor.trestle_caches = None
+			entry[0].release()
+
 	def yaml_completer(path):
 		if not os.path.isfile(path):
 			raise FileNotFoundError(f'expecting a file at {path}')
+		# concurrent workers on the same document share a hidden lock file
+		if lock:
+			path_lock = os.path.join(os.path.dirname(os.path.abspath(path)),
+				'.%s.lock'%os.path.basename(path))
+			with SimpleFlock(path_lock,timeout=lock_timeout):
+				return yaml_completer_unlocked(path)
+		return yaml_completer_unlocked(path)
+
+	def yaml_completer_unlocked(path):
 		with open(path) as fp:
 			text_cache = fp.read()
-		data = yaml.load(text_cache)
-		# hook to post process the data before dumping
-		# note that the postprocessing is a critical feature
-		if hasattr(data,'post'):
-			data.post()
-		# try to dump the file, now with tags
-		try: 
-			with open(path,'w') as fp:
-				if header:
-					fp.write(header.strip('\n')+'\n')
-				yaml.dump(data,fp)
-		# rewrite the cached text if we cannot dump it to the file
-		except Exception as e:
-			print('warning: writing original data, exception incoming')
-			with open(path,'w') as fp:
-			 	fp.write(text_cache)
-			raise
+		with yaml_borrow() as yaml_this, \
+			yaml_caches(yaml_this,os.path.realpath(path)):
+			data = yaml_this.load(text_cache)
+			# hook to post process the data before dumping
+			# note that the postprocessing is a critical feature
+			if hasattr(data,'post'):
+				data.post()
+			# dump to text first so we can skip the write when nothing changed
+			text = yaml_str(obj=data,yaml=yaml_this)
+		if header:
+			text = header.strip('\n')+'\n'+text
+		# leave the file and its mtime alone if the completed text is identical
+		#   so that file watchers and build caches are not triggered
+		if rewrite_unchanged or text != text_cache:
+			# the atomic write replaces the file only after the new text is on
+			#   disk so a failure leaves the original untouched
+			write_atomic(path,text)
 		# we mark that the document is validated by attaching its path
 		data._path = path
 		return data
 
-	def yaml_completer_text(text):
-		data = yaml.load(text)
-		# hook to post process the data before dumping
-		# note that the postprocessing is a critical feature
-		if hasattr(data,'post'):
-			data.post()
-		return yaml_str(obj=data,yaml=yaml)
+	def yaml_completer_text(text,stream=None):
+		with yaml_borrow() as yaml_this, yaml_caches(yaml_this,None):
+			data = yaml_this.load(text)
+			# hook to post process the data before dumping
+			# note that the postprocessing is a critical feature
+			if hasattr(data,'post'):
+				data.post()
+			# write directly to a stream or path instead of returning a string
+			if stream is not None:
+				return yaml_stream(obj=data,yaml=yaml_this,stream=stream)
+			return yaml_str(obj=data,yaml=yaml_this)
 
 	# optionally return a text completer function
 	if get_text_completer:
@@ -134,6 +249,107 @@ def build_trestle(*,tags,yaml,get_text_completer=False,header=None):
 	else:
 		return yaml_completer
 
+# each worker process in a trestle batch holds its own completer
+_trestle_batch_completer = None
+
+def _trestle_batch_init(tags,yaml_factory,kwargs):
+	"""Build a completer once for each worker in the batch pool."""
+	global _trestle_batch_completer
+	yaml = yaml_factory() if yaml_factory else ruamel.yaml.YAML(typ='rt')
+	_trestle_batch_completer = build_trestle(tags=tags,yaml=yaml,**kwargs)
+
+def _trestle_batch_complete(path):
+	"""Complete one file in a worker and report the outcome."""
+	start = time.time()
+	try: 
+		_trestle_batch_completer(path)
+		error = None
+	except Exception as e:
+		error = ''.join(traceback.format_exception_only(type(e),e)).strip()
+	return path,error,time.time()-start
+
+def trestle_batch(paths,*,tags,yaml_factory=None,workers=None,
+	verbose=True,**kwargs):
+	"""
+	Complete many trestle files in a process pool.
+	Send a list of paths or a glob, along with the tags. Each worker registers 
+	the tags on a YAML instance from `yaml_factory`, which must be picklable, 
+	or a round-trip parser by default. Remaining kwargs go to build_trestle.
+	Yields a DotDict for each file as it completes.
+	"""
+	if isinstance(paths,str):
+		paths = sorted(glob.glob(paths,recursive=True))
+	if not workers:
+		workers = get_cpu_cores()
+	start = time.time()
+	count,failed = 0,0
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+		initializer=_trestle_batch_init,
+		initargs=(tags,yaml_factory,kwargs)) as pool:
+		jobs = [pool.submit(_trestle_batch_complete,path) for path in paths]
+		for job in concurrent.futures.as_completed(jobs):
+			path,error,elapsed = job.result()
+			count += 1
+			if error: failed += 1
+			yield DotDict(path=path,error=error,time=elapsed)
+	if verbose:
+		elapsed = time.time()-start
+		print('status: completed %d trestle files (%d failed) in %.2fs '
+			'(%.1f files/s)'%(count,failed,elapsed,
+			count/elapsed if elapsed else 0.))
+
+class TrestleRequired:
+	"""Mark a required field in Trestle.trestle_fields."""
+	pass
+
+def trestle_compile_constructor(cls):
+	"""
+	Compile a constructor for mapping nodes from declared trestle_fields.
+	We validate keys before building any values and avoid the generic cascade 
+	in Trestle.from_yaml. Missing optional fields receive their declared
+	defaults.
+	"""
+	defaults = dict([(key,val) for key,val in cls.trestle_fields.items()
+		if val is not TrestleRequired])
+	fields = frozenset(cls.trestle_fields)
+	required = frozenset(key for key,val in cls.trestle_fields.items()
+		if val is TrestleRequired)
+	tag_merge = 'tag:yaml.org,2002:merge'
+	def construct(constructor,node):
+		pairs = node.value
+		# merge keys need the generic flattening in construct_mapping
+		if any(getattr(key.tag,'value',key.tag) == tag_merge 
+			for key,_ in pairs):
+			data = ruamel.yaml.constructor.SafeConstructor.construct_mapping(
+				constructor,node,deep=True)
+			keys = list(data.keys())
+		else:
+			data = None
+			# check duplicates like construct_mapping, which keeps the first
+			#   value when they are allowed and raises otherwise
+			seen,unique = {},[]
+			for key_node,val_node in pairs:
+				key = constructor.construct_object(key_node,deep=True)
+				if constructor.check_mapping_key(node,key_node,seen,key,
+					getattr(val_node,'value',val_node)):
+					seen[key] = getattr(val_node,'value',val_node)
+					unique.append((key,val_node))
+			keys = [key for key,_ in unique]
+		unexpected = [key for key in keys if key not in fields]
+		missing = required.difference(keys)
+		if unexpected or missing:
+			raise Exception(f'exception when building class from yaml: {cls}: '
+				+(f'unexpected keys: {unexpected} ' if unexpected else '')
+				+(f'missing keys: {sorted(missing)}' if missing else ''))
+		if data is None:
+			data = dict([(key,constructor.construct_object(val,deep=True))
+				for key,val in unique])
+		for key,val in defaults.items():
+			if key not in data: data[key] = val
+		return cls(**data)
+	construct.__name__ = f'construct_{cls.__name__}'
+	return construct
+
 class Trestle:
 	"""
 	Base class for round-trip YAML tagging and modification.
@@ -144,6 +360,21 @@ class Trestle:
 	#   instead also using a builder to construct certain types of root level
 	#   objects where appropriate
 
+	# an empty __slots__ lets subclasses from trestle_slots drop the __dict__
+	__slots__ = ()
+
+	# declare fields as a dict of defaults with TrestleRequired for required
+	#   fields to compile a fast constructor for mapping nodes
+	trestle_fields = None
+	_trestle_compiled = None
+	# intern repeated strings in trestle_nesting_typer
+	trestle_memo = False
+
+	def __init_subclass__(cls,**kwargs):
+		super().__init_subclass__(**kwargs)
+		cls._trestle_compiled = (trestle_compile_constructor(cls) 
+			if cls.trestle_fields is not None else None)
+
 	@classmethod
 	def to_yaml(cls,representer,node):
 		# the clean property prepares the data for export to yaml
@@ -163,12 +394,20 @@ class Trestle:
 				raise NotImplementedError('base class from tag '
 					f'{cls.yaml_tag} cannot return {cleaned}')
 		except:
-			print(f'failed to write clean data {node.__dict__} with '
+			detail = getattr(node,'__dict__',None)
+			if detail is None:
+				detail = dict([(key,getattr(node,key,None)) 
+					for key in cls.__slots__])
+			print(f'failed to write clean data {detail} with '
 				f'tag {cls.yaml_tag}')
 			raise
 
 	@classmethod
 	def from_yaml(cls,constructor,node):
+		# classes with declared fields use a compiled constructor for mappings
+		if (cls._trestle_compiled is not None and 
+			type(node) is ruamel.yaml.nodes.MappingNode):
+			return cls._trestle_compiled(constructor,node)
 		# mapping nodes are constructed deep
 		if isinstance(node,ruamel.yaml.nodes.MappingNode):
 			data = ruamel.yaml.constructor.SafeConstructor.construct_mapping(
@@ -212,11 +451,97 @@ class Trestle:
 		else:
 			raise TypeError(f'unprepared to interpret type for {node}')
 
+def _trestle_dispatch(cls,child):
+	"""Build one child of a TrestleDocument in a pool."""
+	return cls.trestle_dispatcher(**child)
+
+def trestle_node_hash(node):
+	"""
+	Hash a YAML node by its structure, tags, and scalar values.
+	"""
+	# we only read the nodes here and never build objects from their values
+	digest = hashlib.sha1()
+	def walk(node):
+		tag = getattr(node.tag,'value',node.tag)
+		digest.update(f'{node.__class__.__name__}:{tag}:'.encode())
+		if isinstance(node,ruamel.yaml.nodes.ScalarNode):
+			digest.update(f'{len(node.value)}:{node.value};'.encode())
+		elif isinstance(node,ruamel.yaml.nodes.SequenceNode):
+			for item in node.value:
+				walk(item)
+			digest.update(b']')
+		elif isinstance(node,ruamel.yaml.nodes.MappingNode):
+			for key,val in node.value:
+				walk(key)
+				walk(val)
+			digest.update(b'}')
+	walk(node)
+	return digest.hexdigest()
+
+def trestle_slots(cls):
+	"""
+	Decorator to rebuild a Trestle subclass with __slots__ from trestle_fields.
+	Every base class must also define __slots__, otherwise instances keep a 
+	__dict__. We add a keyword constructor and a clean property which drops 
+	null fields when the class does not define them.
+	"""
+	if cls.trestle_fields is None:
+		raise Exception(f'trestle_slots requires trestle_fields on {cls}')
+	for base in cls.__mro__[1:-1]:
+		if '__slots__' not in base.__dict__:
+			raise Exception(f'base class {base} of {cls} has no __slots__')
+	fields = dict(cls.trestle_fields)
+	namespace = dict(cls.__dict__)
+	for key in ['__dict__','__weakref__','_trestle_compiled']:
+		namespace.pop(key,None)
+	namespace['__slots__'] = tuple(fields)
+	if '__init__' not in namespace:
+		def __init__(self,**kwargs):
+			unexpected = [key for key in kwargs if key not in fields]
+			if unexpected:
+				raise TypeError(f'{cls.__name__} got unexpected keyword '
+					f'arguments: {unexpected}')
+			for key,default in fields.items():
+				val = kwargs.get(key,default)
+				if val is TrestleRequired:
+					raise TypeError(f'{cls.__name__} missing required '
+						f'argument: {key}')
+				setattr(self,key,val)
+		namespace['__init__'] = __init__
+	if 'clean' not in namespace:
+		namespace['clean'] = property(lambda self: dict([
+			(key,getattr(self,key)) for key in fields 
+			if getattr(self,key) is not None]))
+	namespace['__qualname__'] = cls.__qualname__
+	cls_new = type(cls)(cls.__name__,cls.__bases__,namespace)
+	# methods that use super() without arguments hold the old class in their 
+	#   __class__ cell so we point them to the new one, as dataclasses does
+	for member in cls_new.__dict__.values():
+		if isinstance(member,(classmethod,staticmethod)):
+			funcs = [member.__func__]
+		elif isinstance(member,property):
+			funcs = [member.fget,member.fset,member.fdel]
+		else: funcs = [member]
+		for func in funcs:
+			func = inspect.unwrap(func) if callable(func) else None
+			closure = getattr(func,'__closure__',None)
+			if not closure: continue
+			for name,cell in zip(func.__code__.co_freevars,closure):
+				if name == '__class__' and cell.cell_contents is cls:
+					cell.cell_contents = cls_new
+	return cls_new
+
 class TrestleDocument(Trestle):
 	yaml_tag = None
 	trestle_dispatcher = None
 	trestle_kind = list
 	trestle_name = 'data'
+	# incremental documents reuse completed children whose nodes are unchanged
+	#   when a completer from build_trestle loads the same path again
+	trestle_incremental = False
+	# build children in a pool with "thread", "process", or an Executor
+	trestle_executor = None
+	trestle_workers = None
 	def __init__(self,*args,**kwargs):
 		"""
 		Subclass this to tag a YAML document and send each object in the mapping
@@ -231,61 +556,167 @@ class TrestleDocument(Trestle):
 				'points to a Dispatcher which receives and builds the objects '
 				f'for this document (kind: {self.trestle_kind})')
 		if self.trestle_kind == list:
-			data = []
 			if kwargs:
 				raise Exception(f'trestle document list got kwargs: {kwargs}')
-			for child in args:
-				# pass through tagged objects
-				tag = getattr(child,'yaml_tag',None)
-				item = self.trestle_dispatcher(**child) if not tag else child
-				data.append(item)
+			items = list(enumerate(args))
 		elif self.trestle_kind == dict:
 			# dev: the following needs a test
 			if args:
 				raise Exception(f'trestle document dict got args: {kwargs}')
-			data = {}
-			for key,child in kwargs.items():
-				# pass through tagged objects
-				tag = getattr(child,'yaml_tag',None)
-				item = self.trestle_dispatcher(**child) if not tag else child
-				data[key] = item
+			items = list(kwargs.items())
 		else:
 			raise ValueError(f'invalid trestle_kind: {self.trestle_kind}')
+		# pass through tagged objects and dispatch the rest
+		pending = [(key,child) for key,child in items 
+			if not getattr(child,'yaml_tag',None)]
+		if self.trestle_executor and len(pending)>1:
+			built = self._trestle_dispatch_pool(pending)
+		else:
+			built = dict([(key,self.trestle_dispatcher(**child)) 
+				for key,child in pending])
+		if self.trestle_kind == list:
+			data = [built.get(key,child) for key,child in items]
+		else:
+			data = dict([(key,built.get(key,child)) for key,child in items])
 		setattr(self,self.trestle_name,data)
 
+	def _trestle_dispatch_pool(self,pending):
+		"""
+		Dispatch children in a thread or process pool.
+		"""
+		executor = self.trestle_executor
+		if isinstance(executor,concurrent.futures.Executor):
+			pool,owned = executor,False
+		elif executor in ('thread','process'):
+			kind = (concurrent.futures.ThreadPoolExecutor 
+				if executor == 'thread' else 
+				concurrent.futures.ProcessPoolExecutor)
+			pool = kind(max_workers=self.trestle_workers or get_cpu_cores())
+			owned = True
+		else:
+			raise ValueError(f'invalid trestle_executor: {executor}')
+		try:
+			# the class is pickled by reference, unlike the Dispatcher instance
+			jobs = [(key,pool.submit(_trestle_dispatch,
+				self.__class__,dict(child))) for key,child in pending]
+			built,errors = {},{}
+			for key,job in jobs:
+				try: built[key] = job.result()
+				except Exception as e: errors[key] = e
+		finally:
+			if owned: pool.shutdown()
+		if errors:
+			raise ExceptionTrestleChildren(errors)
+		return built
+
 	@property
 	def clean(self):
 		return getattr(self,self.trestle_name)
 
-def trestle_nesting_typer(cls,obj):
+	@classmethod
+	def from_yaml(cls,constructor,node):
+		"""
+		Construct the document, optionally reusing cached children.
+		"""
+		# the incremental mode caches the completed form of each child by a
+		#   hash of its node so only new or edited children are constructed and
+		#   dispatched. the cache holds children from the latest document at a path.
+		#   note that the first completion tags each child, hence the tagged 
+		#   children are built once more on the next completion, after which 
+		#   they are served from the cache
+		# completers lend the constructor a cache for the current path so that
+		#   different files never share children
+		caches = getattr(constructor,'trestle_caches',None)
+		if not cls.trestle_incremental or caches is None:
+			return super().from_yaml(constructor,node)
+		# identical children share a hash so we keep a list of objects for each
+		#   hash and use each one once, otherwise ruamel writes aliases
+		cache = dict([(key,list(objs)) 
+			for key,objs in caches.get(cls,{}).items()])
+		def build(key,child):
+			if cache.get(key): return cache[key].pop(0)
+			return constructor.construct_object(child,deep=True)
+		def store(pairs):
+			cache_new = {}
+			for key,obj in pairs: cache_new.setdefault(key,[]).append(obj)
+			caches[cls] = cache_new
+		if (cls.trestle_kind == list and 
+			isinstance(node,ruamel.yaml.nodes.SequenceNode)):
+			keys = [trestle_node_hash(child) for child in node.value]
+			args = [build(key,child) for key,child in zip(keys,node.value)]
+			out = cls(*args)
+			store(zip(keys,getattr(out,cls.trestle_name)))
+		elif (cls.trestle_kind == dict and 
+			isinstance(node,ruamel.yaml.nodes.MappingNode)):
+			keys,kwargs = [],{}
+			for key_node,child in node.value:
+				name = constructor.construct_object(key_node,deep=True)
+				key = trestle_node_hash(child)
+				keys.append((name,key))
+				kwargs[name] = build(key,child)
+			out = cls(**kwargs)
+			data = getattr(out,cls.trestle_name)
+			store([(key,data[name]) for name,key in keys])
+		else:
+			return super().from_yaml(constructor,node)
+		return out
+
+def _trestle_typer_resolve(kind):
 	"""
-	Helper to convert incoming types to the right class.
-	This is necessary for classes that hold other YAML objects as attributes and
-	therefore is required for nesting these structures in the YAML document. It
-	should be used in the class constructors
+	Choose the conversion for an incoming type in trestle_nesting_typer.
 	"""
-	# if the object is already an instance of the class, it passes through
-	if isinstance(obj,cls):
-		return obj
 	# null values also pass through
-	elif obj == None:
-		return None
+	if issubclass(kind,type(None)):
+		return lambda cls,obj: None
 	# if we receive a string, we use a send a "value" keyword to the constructor
-	elif isinstance(obj,str):
-		return cls(value=obj)
+	elif issubclass(kind,str):
+		return lambda cls,obj: cls(value=obj)
 	# the dict is mapped to kwargs
-	elif isinstance(obj,dict):
-		return cls(**obj)
+	elif issubclass(kind,dict):
+		return lambda cls,obj: cls(**obj)
 	# a list is sent to args
-	elif isinstance(obj,typing.Sequence):
-		return cls(*obj)
+	elif issubclass(kind,typing.Sequence):
+		return lambda cls,obj: cls(*obj)
 	# should we ever need to handle SequenceNode or Mapping node here
-	elif isinstance(obj,ruamel.yaml.nodes.SequenceNode):
-		args = ruamel.yaml.constructor.SafeConstructor.construct_sequence(obj)
-		return cls(*args)
-	elif isinstance(obj,ruamel.yaml.nodes.MappingNode):
-		kwargs = ruamel.yaml.constructor.SafeConstructor.construct_mapping(obj)
-		return cls(**kwargs)
+	elif issubclass(kind,ruamel.yaml.nodes.SequenceNode):
+		return lambda cls,obj: cls(
+			*ruamel.yaml.constructor.SafeConstructor.construct_sequence(obj))
+	elif issubclass(kind,ruamel.yaml.nodes.MappingNode):
+		return lambda cls,obj: cls(
+			**ruamel.yaml.constructor.SafeConstructor.construct_mapping(obj))
 	else:
-		raise TypeError(
-			f'cannot convert incoming object "{obj}" to class "{cls}"')
+		return None
+
+# conversions for trestle_nesting_typer keyed by type(obj) so we only walk the
+#   isinstance cascade once for each incoming type
+_trestle_typer_table = {}
+
+def trestle_nesting_typer(cls,obj,memo=None):
+	"""
+	Helper to convert incoming types to the right class.
+	This is necessary for classes that hold other YAML objects as attributes and
+	therefore is required for nesting these structures in the YAML document. It
+	should be used in the class constructors. Set `memo`, or the trestle_memo 
+	attribute on the class, to intern strings so that repeated strings share
+	memory. We never share the objects we build, since they are mutable and
+	ruamel would dump shared objects as aliases.
+	"""
+	# if the object is already an instance of the class, it passes through
+	if isinstance(obj,cls):
+		return obj
+	kind = type(obj)
+	convert = _trestle_typer_table.get(kind)
+	if convert is None:
+		convert = _trestle_typer_resolve(kind)
+		if convert is None:
+			raise TypeError(
+				f'cannot convert incoming object "{obj}" to class "{cls}"')
+		_trestle_typer_table[kind] = convert
+	if memo is None:
+		memo = getattr(cls,'trestle_memo',False)
+	if memo and kind is str:
+		return convert(cls,sys.intern(obj))
+	elif memo and kind is tuple:
+		return convert(cls,tuple(sys.intern(i) if type(i) is str else i 
+			for i in obj))
+	return convert(cls,obj)